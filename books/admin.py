@@ -4,10 +4,10 @@ from .models import Book, Category, ContactMessage
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'price', 'category', 'is_available', 'created_at']
+    list_display = ['title', 'author', 'price', 'stock', 'category', 'is_available', 'created_at']
     list_filter = ['category', 'is_available', 'created_at']
     search_fields = ['title', 'author', 'description']
-    list_editable = ['price', 'is_available']
+    list_editable = ['price', 'stock', 'is_available']
     readonly_fields = ['created_at', 'updated_at']
     prepopulated_fields = {'slug': ('title',)}
     
@@ -16,7 +16,7 @@ class BookAdmin(admin.ModelAdmin):
             'fields': ('title', 'slug', 'author', 'category')
         }),
         ('Pricing and Availability', {
-            'fields': ('price', 'is_available')
+            'fields': ('price', 'stock', 'is_available')
         }),
         ('Content', {
             'fields': ('description', 'image')
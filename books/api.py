@@ -1,276 +1,359 @@
-from rest_framework import serializers
+"""
+The REST API. Read-only catalog endpoints build their querysets with
+``books.queries`` (shared with the HTML views and ``books.async_api``) and
+serialize through ``books.fast_serializers``; the cart has one endpoint,
+``cart_api``, whose handlers also back the older cart URLs.
+"""
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from rest_framework.throttling import SimpleRateThrottle
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_GET
+from .cache import get_book_detail, get_book_validators, get_catalog_validators
+from .cart import BookRemoved, Cart
+from .conditional import public_api
+from .export import FORMATS as EXPORT_FORMATS, accepts_gzip, export_chunks
+from .facets import facet_counts, selected_facets
+from .fast_serializers import BOOK_LIST_COLUMNS, book_values, serialize_book_list, serialize_books
+from .inventory import OutOfStock
 from .models import Book, Category
+from .pagination import KeysetPagination
+from .queries import catalog_books, featured_books as featured_queryset
+from .serializers import BookSerializer, CartSerializer, CategorySerializer
+import hmac
 from decimal import Decimal
 
 
-class BookSerializer(serializers.ModelSerializer):
-    category_name = serializers.CharField(source='category.name', read_only=True)
-    price_display = serializers.SerializerMethodField()
-    
-    class Meta:
-        model = Book
-        fields = ['id', 'title', 'slug', 'author', 'description', 'price', 'price_display', 
-                  'image', 'is_available', 'category', 'category_name', 'created_at']
-    
-    def get_price_display(self, obj):
-        return f"₹{obj.price:.2f}"
-
-
-class CategorySerializer(serializers.ModelSerializer):
-    book_count = serializers.SerializerMethodField()
-    
-    class Meta:
-        model = Category
-        fields = ['id', 'name', 'slug', 'book_count', 'created_at']
-    
-    def get_book_count(self, obj):
-        return obj.book_set.filter(is_available=True).count()
-
-
-class CartItemSerializer(serializers.Serializer):
-    book_id = serializers.IntegerField()
-    quantity = serializers.IntegerField(min_value=1)
-    title = serializers.CharField(read_only=True)
-    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-    total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
-
-
-class CartSerializer(serializers.Serializer):
-    items = CartItemSerializer(many=True)
-    total_items = serializers.IntegerField()
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
-    total_price_display = serializers.SerializerMethodField()
-    
-    def get_total_price_display(self, obj):
-        return f"₹{obj['total_price']:.2f}"
-
-
 class BookViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint to view all books
     """
-    queryset = Book.objects.filter(is_available=True)
+    queryset = Book.objects.for_listing()
     serializer_class = BookSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        queryset = Book.objects.filter(is_available=True)
-        category = self.request.query_params.get('category')
-        search = self.request.query_params.get('search')
-        
-        if category:
-            queryset = queryset.filter(category__slug=category)
-        
-        if search:
-            queryset = queryset.filter(
-                title__icontains=search
-            ) | queryset.filter(
-                author__icontains=search
-            ) | queryset.filter(
-                description__icontains=search
-            )
+        queryset = catalog_books(
+            query=self.request.query_params.get('search'),
+            facets=selected_facets(self.request.query_params),
+        )
         
         # Featured books (top 8 by price)
-        featured = self.request.query_params.get('featured')
-        if featured:
-            queryset = queryset.order_by('-price')[:8]
+        if self.request.query_params.get('featured'):
+            queryset = featured_queryset(queryset)
         
         return queryset
+    
+    def list(self, request, *args, **kwargs):
+        # Same output as BookSerializer, built from .values() rows
+        queryset = book_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = serialize_books(rows, request)
+        if page is not None:
+            # Counts for drilling down from here (see books.facets)
+            return Response({
+                **self.paginator.get_paginated_data(data),
+                'facets': facet_counts(request.query_params.get('search'), selected_facets(request.query_params)),
+            })
+        return Response(data)
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint to view all categories
     """
-    queryset = Category.objects.all()
+    queryset = Category.objects.with_stats()
     serializer_class = CategorySerializer
+    # Public responses are shared by everyone, see books.conditional
+    authentication_classes = []
     permission_classes = [AllowAny]
+    
+    @method_decorator(public_api(get_catalog_validators))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
 
-@api_view(['GET', 'POST', 'DELETE'])
-@permission_classes([AllowAny])
-def cart_api(request):
-    """
-    API endpoint to handle shopping cart operations
-    """
-    if request.method == 'GET':
-        # Get cart from session
-        cart = request.session.get('cart', {})
-        
-        # Calculate cart details
-        items = []
-        total_price = Decimal('0.00')
-        total_items = 0
-        
-        for book_id, item_data in cart.items():
-            try:
-                book = Book.objects.get(id=int(book_id), is_available=True)
-                quantity = item_data.get('quantity', 1)
-                item_total = book.price * quantity
-                
-                items.append({
-                    'book_id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'price': float(book.price),
-                    'quantity': quantity,
-                    'total': float(item_total),
-                    'image': book.image.url if book.image else None
-                })
-                
-                total_price += item_total
-                total_items += quantity
-                
-            except Book.DoesNotExist:
-                continue
-        
-        cart_data = {
-            'items': items,
-            'total_items': total_items,
-            'total_price': float(total_price)
-        }
-        
-        serializer = CartSerializer(cart_data)
-        return Response(serializer.data)
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cart_contents(request):
+    cart = Cart.for_request(request).items
     
-    elif request.method == 'POST':
-        # Add item to cart
-        book_id = str(request.data.get('book_id'))
-        quantity = request.data.get('quantity', 1)
-        
-        if not book_id:
-            return Response(
-                {'error': 'Book ID is required'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+    # Calculate cart details
+    items = []
+    total_price = Decimal('0.00')
+    total_items = 0
+    books = Book.objects.available().only('id', 'title', 'author', 'price', 'image').in_bulk(
+        [int(book_id) for book_id in cart]
+    )
+    
+    for book_id, item_data in cart.items():
         try:
-            book = Book.objects.get(id=int(book_id), is_available=True)
-            
-            # Get or create cart
-            cart = request.session.get('cart', {})
-            
-            # Add or update item in cart
-            if book_id in cart:
-                cart[book_id]['quantity'] += quantity
-            else:
-                cart[book_id] = {
-                    'quantity': quantity
-                }
+            book = books[int(book_id)]
+            quantity = item_data.get('quantity', 1)
+            item_total = book.price * quantity
             
-            # Save cart to session
-            request.session['cart'] = cart
-            request.session.modified = True
-            
-            return Response({
-                'message': 'Item added to cart successfully',
-                'cart_total': sum(item['quantity'] for item in cart.values())
+            items.append({
+                'book_id': book.id,
+                'title': book.title,
+                'author': book.author,
+                'price': float(book.price),
+                'quantity': quantity,
+                'total': float(item_total),
+                'image': book.image.url if book.image else None
             })
             
-        except Book.DoesNotExist:
-            return Response(
-                {'error': 'Book not found'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-    
-    elif request.method == 'DELETE':
-        # Clear cart or remove specific item
-        book_id = request.data.get('book_id')
-        cart = request.session.get('cart', {})
-        
-        if book_id:
-            # Remove specific item
-            if book_id in cart:
-                del cart[book_id]
-                request.session['cart'] = cart
-                request.session.modified = True
-                
-                return Response({
-                    'message': 'Item removed from cart',
-                    'cart_total': sum(item['quantity'] for item in cart.values())
-                })
-            else:
-                return Response(
-                    {'error': 'Item not found in cart'}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        else:
-            # Clear entire cart
-            request.session['cart'] = {}
-            request.session.modified = True
+            total_price += item_total
+            total_items += quantity
             
-            return Response({
-                'message': 'Cart cleared successfully'
-            })
+        except KeyError:
+            continue
+    
+    cart_data = {
+        'items': items,
+        'total_items': total_items,
+        'total_price': float(total_price)
+    }
+    
+    serializer = CartSerializer(cart_data)
+    return Response(serializer.data)
 
 
-@api_view(['PUT'])
-@permission_classes([AllowAny])
-def update_cart_item(request, book_id):
+def _change_cart(request, book_id, change):
     """
-    API endpoint to update cart item quantity
+    Validate ``book_id`` and the ``quantity`` in the request body, then
+    call ``change(cart, book, quantity)`` and return its response
     """
+    book_id = _int(book_id)
+    if book_id is None:
+        return Response(
+            {'error': 'Book ID is required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    quantity = _int(request.data.get('quantity', 1))
+    if quantity is None or quantity <= 0:
+        return Response(
+            {'error': 'Quantity must be greater than 0'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
     try:
-        book = Book.objects.get(id=int(book_id), is_available=True)
-        quantity = request.data.get('quantity', 1)
-        
-        if quantity <= 0:
-            return Response(
-                {'error': 'Quantity must be greater than 0'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        cart = request.session.get('cart', {})
-        
-        if str(book_id) in cart:
-            cart[str(book_id)]['quantity'] = quantity
-            request.session['cart'] = cart
-            request.session.modified = True
-            
+        book = Book.objects.available().get(id=book_id)
+        return change(Cart.for_request(request), book, quantity)
+    
+    except OutOfStock as exc:
+        return Response(
+            {'error': str(exc), 'available': exc.available}, 
+            status=status.HTTP_409_CONFLICT
+        )
+    except (Book.DoesNotExist, BookRemoved):
+        cart = Cart.for_request(request)
+        if book_id in cart and not Book.objects.filter(id=book_id).exists():
+            # Deleted from the catalog: drop the stale line
+            cart.remove(book_id)
+        return Response(
+            {'error': 'Book not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+
+def _add_to_cart(request, book_id):
+    def add(cart, book, quantity):
+        cart.add(book, quantity)
+        return Response({
+            'message': 'Item added to cart successfully',
+            'cart_total': cart.count()
+        })
+    return _change_cart(request, book_id, add)
+
+
+def _update_cart_item(request, book_id):
+    def update(cart, book, quantity):
+        if cart.update(book.id, quantity):
             return Response({
                 'message': 'Cart item updated successfully',
                 'quantity': quantity
             })
-        else:
-            return Response(
-                {'error': 'Item not found in cart'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-            
-    except Book.DoesNotExist:
         return Response(
-            {'error': 'Book not found'}, 
+            {'error': 'Item not found in cart'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    return _change_cart(request, book_id, update)
+
+
+def _remove_from_cart(request, book_id):
+    cart = Cart.for_request(request)
+    
+    if cart.remove(book_id):
+        return Response({
+            'message': 'Item removed from cart',
+            'cart_total': cart.count()
+        })
+    return Response(
+        {'error': 'Item not found in cart'}, 
+        status=status.HTTP_404_NOT_FOUND
+    )
+
+
+@api_view(['GET', 'POST', 'PUT', 'DELETE'])
+@permission_classes([AllowAny])
+def cart_api(request):
+    """
+    API endpoint for the shopping cart: GET the contents, POST ``book_id``
+    (and ``quantity``) to add copies, PUT ``book_id`` and ``quantity`` to
+    set a line's quantity, DELETE ``book_id`` to remove a line or nothing
+    to clear the cart
+    """
+    if request.method == 'GET':
+        return _cart_contents(request)
+    
+    book_id = request.data.get('book_id')
+    if request.method == 'POST':
+        return _add_to_cart(request, book_id)
+    if request.method == 'PUT':
+        return _update_cart_item(request, book_id)
+    
+    if book_id:
+        return _remove_from_cart(request, book_id)
+    
+    Cart.for_request(request).clear()
+    return Response({
+        'message': 'Cart cleared successfully'
+    })
+
 
+# Older cart URLs, kept for existing clients; same handlers as cart_api
 
+@api_view(['PUT'])
+@permission_classes([AllowAny])
+def update_cart_item(request, book_id):
+    """API endpoint to update cart item quantity (PUT /api/cart/ with ``book_id``)"""
+    return _update_cart_item(request, book_id)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def add_to_cart_api(request):
+    """API endpoint to add a book to the cart (POST /api/cart/)"""
+    return _add_to_cart(request, request.data.get('book_id'))
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def remove_from_cart_api(request):
+    """API endpoint to remove a book from the cart (DELETE /api/cart/ with ``book_id``)"""
+    return _remove_from_cart(request, request.data.get('book_id'))
+
+
+@public_api(get_catalog_validators)
 @api_view(['GET'])
+@authentication_classes([])
 @permission_classes([AllowAny])
 def featured_books(request):
     """
     API endpoint to get featured books
     """
-    featured_books = Book.objects.filter(is_available=True).order_by('-price')[:8]
-    serializer = BookSerializer(featured_books, many=True)
+    data = serialize_books(book_values(featured_queryset()))
     
     return Response({
-        'featured_books': serializer.data,
-        'count': len(serializer.data)
+        'featured_books': data,
+        'count': len(data)
     })
 
 
+@public_api(get_book_validators)
 @api_view(['GET'])
+@authentication_classes([])
 @permission_classes([AllowAny])
 def book_detail_api(request, slug):
     """
     API endpoint to get book details by slug
     """
-    book = get_object_or_404(Book, slug=slug, is_available=True)
-    serializer = BookSerializer(book)
+    # Shares the cached lookup used for the ETag
+    detail = get_book_detail(slug)
+    if detail is None:
+        raise Http404('No Book matches the given query.')
+    serializer = BookSerializer(detail[0])
     
     return Response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_books_api(request):
+    """API endpoint to search books"""
+    books = catalog_books(category=request.GET.get('category'), query=request.GET.get('q'))
+    
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(book_values(books, BOOK_LIST_COLUMNS), request)
+    return paginator.get_paginated_response(serialize_book_list(page))
+
+
+class CatalogExportThrottle(SimpleRateThrottle):
+    """``CATALOG_EXPORT_RATE`` exports per staff user or, for token clients, per IP"""
+    scope = 'catalog_export'
+    
+    def get_cache_key(self, request, view):
+        user = request.user
+        ident = f'user:{user.pk}' if user.is_authenticated else self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+def _can_export(request):
+    token = getattr(settings, 'CATALOG_EXPORT_TOKEN', '')
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+    return request.user.is_active and request.user.is_staff
+
+
+@require_GET
+def export_catalog(request):
+    """
+    Stream the whole catalog as NDJSON (default) or CSV with ``?format=csv``,
+    for staff and ``CATALOG_EXPORT_TOKEN`` holders, throttled by
+    ``CatalogExportThrottle``. Compressed on the fly when the client accepts
+    gzip. A plain Django view, so DRF neither buffers the body nor treats
+    ``format`` as a renderer.
+    """
+    if not _can_export(request):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    throttle = CatalogExportThrottle()
+    if not throttle.allow_request(request, None):
+        response = JsonResponse({'error': 'Too many exports'}, status=429)
+        wait = throttle.wait()
+        if wait is not None:
+            response['Retry-After'] = str(int(wait) + 1)
+        return response
+    
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'Unknown format {export_format!r}'}, status=400)
+    
+    queryset = Book.objects.all()
+    if request.GET.get('available', '1') != '0':
+        queryset = queryset.available()
+    
+    compress = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+    response = StreamingHttpResponse(
+        export_chunks(export_format, queryset, compress=compress),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="catalog.{export_format}"'
+    patch_vary_headers(response, ('Accept-Encoding', 'Authorization'))
+    patch_cache_control(response, private=True)
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    return response
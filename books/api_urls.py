@@ -1,24 +1,34 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api import (
-    BookViewSet, 
-    CategoryViewSet, 
-    cart_api, 
-    update_cart_item,
-    featured_books,
-    book_detail_api
-)
+from . import api, async_api
 
 # Create a router and register our viewsets with it
 router = DefaultRouter()
-router.register(r'books', BookViewSet, basename='book')
-router.register(r'categories', CategoryViewSet, basename='category')
+router.register(r'books', api.BookViewSet, basename='book')
+router.register(r'categories', api.CategoryViewSet, basename='category')
+
+# Read-only catalog endpoints: DRF views, or their async versions for
+# ASGI deployments (see books.async_api)
+catalog = async_api if getattr(settings, 'CATALOG_ASYNC_API', False) else api
+catalog_urlpatterns = [
+    path('featured/', catalog.featured_books, name='featured-books-api'),
+    path('book/<slug:slug>/', catalog.book_detail_api, name='book-detail-api'),
+    path('search/', catalog.search_books_api, name='search-books-api'),
+    # Older paths, kept for existing clients
+    path('books/featured/', catalog.featured_books),
+    path('books/search/', catalog.search_books_api),
+]
+if catalog is async_api:
+    catalog_urlpatterns.append(path('categories/', async_api.categories_api, name='category-list'))
 
 # Wire up our API using automatic URL routing
-urlpatterns = [
+urlpatterns = catalog_urlpatterns + [
     path('', include(router.urls)),
-    path('cart/', cart_api, name='cart-api'),
-    path('cart/update/<int:book_id>/', update_cart_item, name='update-cart-item'),
-    path('featured/', featured_books, name='featured-books-api'),
-    path('book/<slug:slug>/', book_detail_api, name='book-detail-api'),
+    path('cart/', api.cart_api, name='cart-api'),
+    # Older cart paths; cart-api handles all of these
+    path('cart/add/', api.add_to_cart_api, name='add-to-cart-api'),
+    path('cart/remove/', api.remove_from_cart_api, name='remove-from-cart-api'),
+    path('cart/update/<int:book_id>/', api.update_cart_item, name='update-cart-item'),
+    path('export/', api.export_catalog, name='export-catalog'),
 ]
@@ -0,0 +1,96 @@
+"""
+Async versions of the read-only catalog API endpoints.
+
+Under an ASGI server (``bookstore.asgi``) a synchronous view holds a worker
+thread for the whole request. The views here are plain Django ``async def``
+views using the async ORM (``aget``, ``async for``, ``acount``) and the
+async cache API, so waiting on the database or cache doesn't block other
+requests. DRF 3.14 has no async views, so they build their responses
+directly; the JSON is the same as the DRF views they replace, produced by
+the same ``books.fast_serializers`` and ``FastJSONRenderer``.
+
+``books.api_urls`` routes to these views instead of the DRF ones when
+``CATALOG_ASYNC_API`` is set. ``manage.py loadtest_api`` compares the
+throughput of both deployments.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+
+from .cache import get_book_validators, get_catalog_validators
+from .conditional import public_api
+from .fast_serializers import BOOK_LIST_COLUMNS, book_values, serialize_book_list, serialize_books
+from .models import Book, Category
+from .pagination import InvalidCursor, KeysetPagination
+from .queries import catalog_books, featured_books as featured_queryset
+from .renderers import FastJSONRenderer
+from .serializers import CategorySerializer
+
+
+_renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+def read_only(view):
+    """Reject unsafe methods, like ``@api_view(['GET'])``"""
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            response['Allow'] = 'GET, HEAD'
+            return response
+        return await view(request, *args, **kwargs)
+    return wrapped
+
+
+@public_api(get_catalog_validators)
+@read_only
+async def featured_books(request):
+    """API endpoint to get featured books"""
+    data = serialize_books([row async for row in book_values(featured_queryset())])
+
+    return json_response({
+        'featured_books': data,
+        'count': len(data)
+    })
+
+
+@public_api(get_book_validators)
+@read_only
+async def book_detail_api(request, slug):
+    """API endpoint to get book details by slug"""
+    try:
+        row = await book_values(Book.objects.for_listing()).aget(slug=slug)
+    except Book.DoesNotExist:
+        return json_response({'detail': 'Not found.'}, status=404)
+
+    return json_response(serialize_books([row])[0])
+
+
+@read_only
+async def search_books_api(request):
+    """API endpoint to search books"""
+    # Search backends may read their index from disk, so not on the event loop
+    books = await sync_to_async(catalog_books)(
+        category=request.GET.get('category'), query=request.GET.get('q'),
+    )
+
+    paginator = KeysetPagination()
+    try:
+        page = await paginator.apaginate_queryset(book_values(books, BOOK_LIST_COLUMNS), request)
+    except InvalidCursor:
+        return json_response({'detail': 'Invalid cursor'}, status=404)
+    return json_response(paginator.get_paginated_data(serialize_book_list(page)))
+
+
+@public_api(get_catalog_validators)
+@read_only
+async def categories_api(request):
+    """API endpoint to get all categories"""
+    categories = [category async for category in Category.objects.with_stats()]
+    serializer = CategorySerializer(categories, many=True)
+    return json_response(serializer.data)
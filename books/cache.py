@@ -0,0 +1,143 @@
+"""
+Cached catalog lookups for the storefront.
+
+Every cached catalog entry (querysets here, the facet counts of
+``books.facets`` and template fragments in ``home.html``) is keyed on a
+catalog version number.
+Saving or deleting a ``Book`` or ``Category`` bumps the version (see
+``books.signals``), which invalidates all of them at once without having to
+track individual keys.
+
+The ``get_*_validators`` functions return ``(etag, last_modified)`` pairs
+for conditional GET (see ``books.conditional``), cached the same way.
+Cache misses are always filled from the primary database, never a read
+replica (see ``bookstore.db_router``).
+"""
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from bookstore.db_router import read_from_primary
+from .models import Book, Category
+
+
+VERSION_KEY = 'catalog:version'
+
+
+def timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+def catalog_version():
+    """Current catalog version, used to namespace cached entries"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog entry"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def _cached(name, compute):
+    key = f'catalog:{catalog_version()}:{name}'
+    value = cache.get(key)
+    if value is None:
+        # From the primary: a lagging replica could still return what the
+        # version bump was meant to invalidate
+        with read_from_primary():
+            value = compute()
+        cache.set(key, value, timeout())
+    return value
+
+
+def get_featured_books():
+    """The 12 newest available books shown on the home page"""
+    return _cached('featured', lambda: list(
+        Book.objects.for_listing().order_by('-created_at')[:12]
+    ))
+
+
+def get_categories():
+    return _cached('categories', lambda: list(Category.objects.with_stats()))
+
+
+def get_book_detail(slug):
+    """
+    Return ``(book, related_books)`` for an available book, or ``None`` if
+    there is no such book.
+    """
+    def compute():
+        try:
+            book = Book.objects.for_listing().get(slug=slug)
+        except Book.DoesNotExist:
+            return False
+        # Precomputed by books.recommendations, best first
+        related_books = list(
+            Book.objects.for_listing().filter(recommended_with__book=book).order_by('recommended_with__rank')[:4]
+        )
+        if not related_books:
+            # Added since the last compute_related_books run
+            related_books = list(
+                Book.objects.for_listing().filter(category=book.category).exclude(id=book.id)[:4]
+            )
+        return book, related_books
+
+    # ``False`` caches misses too, so unknown slugs don't hit the database
+    return _cached(f'book:{slug}', compute) or None
+
+
+def _validators(*parts):
+    """``(etag, last_modified)`` from the parts that identify a response's content"""
+    etag = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+    modified = [part for part in parts if isinstance(part, datetime)]
+    return etag, max(modified, default=None)
+
+
+def get_book_validators(slug, with_related=False):
+    """
+    HTTP validators for a book's detail data (and its related books, as
+    shown on the detail page), or ``(None, None)`` if there is no such book.
+    """
+    detail = get_book_detail(slug)
+    if detail is None:
+        return None, None
+    book, related_books = detail
+    parts = [book.id, book.updated_at]
+    if book.category:
+        parts += [book.category.name, book.category.updated_at]
+    if with_related:
+        for related in related_books:
+            parts += [related.id, related.updated_at]
+    return _validators(*parts)
+
+
+def get_category_validators():
+    """HTTP validators for the list of categories"""
+    def compute():
+        return Category.objects.aggregate(modified=Max('updated_at'), count=Count('id'))
+
+    categories = _cached('validators:categories', compute)
+    return _validators(categories['count'], categories['modified'])
+
+
+def get_catalog_validators():
+    """
+    HTTP validators for responses covering all available books (and their
+    categories). Book removals are caught by the count, and sales or
+    availability changes update ``updated_at``.
+    """
+    def compute():
+        return Book.objects.available().aggregate(modified=Max('updated_at'), count=Count('id'))
+
+    books = _cached('validators:books', compute)
+    return _validators(books['count'], books['modified'], *get_category_validators())
@@ -0,0 +1,183 @@
+"""
+Shopping cart service.
+
+Carts live in the ``SessionCart`` table keyed by the session key rather than
+inside the session itself, and are only written when they change. Requests
+that merely look at the catalog (or at the cart) therefore never write to
+the database, and visitors without a session cookie cost no cart query at
+all.
+
+The cart's item count and total are stored next to the items and adjusted
+by each mutation, so showing the cart badge never has to parse the items.
+
+Adding or changing a line reserves stock for the session (see
+``books.inventory``); ``OutOfStock`` is raised when not enough copies are
+free, leaving the cart unchanged, and ``BookRemoved`` when a line's book
+has been deleted from the catalog (the line is dropped).
+"""
+from decimal import Decimal
+
+from . import inventory
+from .images import cover_url
+from .models import Book, SessionCart
+
+
+class BookRemoved(Exception):
+    def __init__(self, title):
+        self.title = title
+        super().__init__(f'"{title}" is no longer available and was removed from your cart')
+
+
+class Cart:
+    """The current visitor's shopping cart"""
+
+    def __init__(self, request):
+        self.session = request.session
+        self._items = None
+        self._summary = None
+
+    @classmethod
+    def for_request(cls, request):
+        """Return the cart for ``request``, shared by the view and templates"""
+        cart = getattr(request, '_cart', None)
+        if cart is None:
+            cart = request._cart = cls(request)
+        return cart
+
+    def _row(self, *fields):
+        session_key = self.session.session_key
+        if not session_key:
+            return None
+        return SessionCart.objects.filter(session_key=session_key).values(*fields).first()
+
+    @property
+    def items(self):
+        """``{book_id: {'title', 'author', 'price', 'quantity', 'image'}}``"""
+        if self._items is None:
+            row = self._row('items', 'item_count', 'total')
+            if row is None:
+                self._items, self._summary = {}, (0, Decimal('0.00'))
+            else:
+                self._items = row['items']
+                self._summary = (row['item_count'], row['total'])
+        return self._items
+
+    @property
+    def summary(self):
+        """``(item count, total price)``, without loading the items"""
+        if self._summary is None:
+            row = self._row('item_count', 'total')
+            self._summary = (row['item_count'], row['total']) if row else (0, Decimal('0.00'))
+        return self._summary
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, book_id):
+        return str(book_id) in self.items
+
+    def __bool__(self):
+        return self.count() > 0
+
+    def count(self):
+        """Total number of copies in the cart"""
+        return self.summary[0]
+
+    def total(self):
+        return self.summary[1]
+
+    def lines(self):
+        """Cart rows with ``Decimal`` prices and line totals, for display"""
+        lines = []
+        for book_id, item in self.items.items():
+            quantity = int(item['quantity'])
+            price = Decimal(item['price'])
+            lines.append({
+                'book_id': book_id,
+                'title': item['title'],
+                'author': item['author'],
+                'price': price,
+                'quantity': quantity,
+                'image': item['image'],
+                'item_total': price * quantity,
+            })
+        return lines
+
+    def _adjust(self, item, quantity_delta):
+        count, total = self.summary
+        self._summary = (
+            count + quantity_delta,
+            total + Decimal(item['price']) * quantity_delta,
+        )
+
+    def _session_key(self):
+        # A session row is only created once the visitor actually has a
+        # cart, so anonymous browsing never writes one.
+        if self.session.session_key is None:
+            self.session.save()
+            # Make SessionMiddleware send the new session cookie
+            self.session.modified = True
+        return self.session.session_key
+
+    def add(self, book, quantity=1):
+        book_id = str(book.id)
+        in_cart = int(self.items[book_id]['quantity']) if book_id in self.items else 0
+        inventory.reserve(book, self._session_key(), in_cart + quantity)
+        if book_id in self.items:
+            self.items[book_id]['quantity'] += quantity
+        else:
+            self.items[book_id] = {
+                'title': book.title,
+                'author': book.author,
+                'price': str(book.price),
+                'quantity': quantity,
+                'image': cover_url(book.image.name, book.image_renditions, 160),
+            }
+        self._adjust(self.items[book_id], quantity)
+        self.save()
+
+    def update(self, book_id, quantity):
+        """Set a line's quantity, removing it when ``quantity`` is not positive"""
+        book_id = str(book_id)
+        if book_id not in self.items:
+            return False
+        item = self.items[book_id]
+        if quantity > 0:
+            try:
+                book = Book.objects.only('id', 'title', 'stock').get(id=book_id)
+            except Book.DoesNotExist:
+                self.remove(book_id)
+                raise BookRemoved(item['title'])
+            inventory.reserve(book, self._session_key(), quantity)
+            self._adjust(item, quantity - int(item['quantity']))
+            item['quantity'] = quantity
+        else:
+            self._adjust(item, -int(item['quantity']))
+            del self.items[book_id]
+            inventory.release(self.session.session_key, [book_id])
+        self.save()
+        return True
+
+    def remove(self, book_id):
+        book_id = str(book_id)
+        if book_id not in self.items:
+            return False
+        item = self.items.pop(book_id)
+        self._adjust(item, -int(item['quantity']))
+        inventory.release(self.session.session_key, [book_id])
+        self.save()
+        return True
+
+    def clear(self):
+        self._items = {}
+        self._summary = (0, Decimal('0.00'))
+        if self.session.session_key:
+            SessionCart.objects.filter(session_key=self.session.session_key).delete()
+            inventory.release(self.session.session_key)
+
+    def save(self):
+        count, total = self.summary
+        SessionCart.objects.update_or_create(
+            session_key=self._session_key(),
+            defaults={'items': self.items, 'item_count': count, 'total': total},
+        )
@@ -0,0 +1,137 @@
+"""
+Conditional GET and ``Cache-Control`` for catalog pages and API endpoints.
+
+Views are wrapped with Django's ``condition`` decorator, fed by the cached
+validators in ``books.cache``, so a client or proxy revalidating unchanged
+content gets a ``304 Not Modified`` without the view running at all.
+
+API responses are the same for everyone and are marked ``public`` so a CDN
+or reverse proxy can serve them for ``CATALOG_HTTP_MAX_AGE`` seconds. The
+views behind them must not read the session (DRF views get no
+authentication classes), or ``SessionMiddleware`` would add ``Vary:
+Cookie`` and shared caches would keep a copy per visitor. HTML pages show
+the visitor's cart, flash messages and CSRF token, so they are ``private``
+and always revalidated, with the cart summary and the CSRF secret folded
+into the ETag.
+
+``public_api`` also wraps async views (``books.async_api``); their
+validators run in a thread, as they read the cache and the database.
+"""
+import datetime
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .cart import Cart
+
+
+def _memoized(request, validators, *args, **kwargs):
+    # ``condition`` asks for the ETag and Last-Modified separately
+    if not hasattr(request, '_validators'):
+        request._validators = validators(*args, **kwargs)
+    return request._validators
+
+
+def _async_condition(view, validators):
+    """Django's ``condition`` for an async view, fed by ``validators``"""
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        etag, last_modified = await sync_to_async(validators)(*args, **kwargs)
+        etag = quote_etag(etag) if etag is not None else None
+        if last_modified:
+            if not timezone.is_aware(last_modified):
+                last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+            last_modified = int(last_modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await view(request, *args, **kwargs)
+
+        if request.method in ('GET', 'HEAD'):
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+        return response
+    return wrapped
+
+
+def _public(response):
+    if response.status_code in (200, 304):
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=getattr(settings, 'CATALOG_HTTP_MAX_AGE', 60),
+            stale_while_revalidate=getattr(settings, 'CATALOG_HTTP_STALE_WHILE_REVALIDATE', 300),
+        )
+        # A 304 skips DRF's content negotiation, which adds this
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def public_api(validators):
+    """
+    Decorate a catalog API view; ``validators(*args, **kwargs)`` receives
+    the URL arguments and returns ``(etag, last_modified)``.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            conditional_view = _async_condition(view, validators)
+
+            @wraps(view)
+            async def async_wrapped(request, *args, **kwargs):
+                return _public(await conditional_view(request, *args, **kwargs))
+            return async_wrapped
+
+        conditional_view = condition(
+            etag_func=lambda request, *args, **kwargs: _memoized(request, validators, *args, **kwargs)[0],
+            last_modified_func=lambda request, *args, **kwargs: _memoized(request, validators, *args, **kwargs)[1],
+        )(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            return _public(conditional_view(request, *args, **kwargs))
+        return wrapped
+    return decorator
+
+
+def private_page(validators):
+    """
+    Decorate a catalog HTML view. The ETag also covers the visitor's cart
+    and CSRF secret (so a page cached before the token rotated, e.g. at
+    login, is rendered again), and pages with pending flash messages are
+    always rendered in full.
+    """
+    def etag(request, *args, **kwargs):
+        if len(messages.get_messages(request)):
+            return None
+        content_etag, _ = validators(*args, **kwargs)
+        if content_etag is None:
+            return None
+        count, total = Cart.for_request(request).summary
+        # get_token() returns a freshly masked token on every call; the
+        # secret it leaves in CSRF_COOKIE is what stays the same
+        get_token(request)
+        csrf_secret = request.META.get('CSRF_COOKIE', '')
+        return hashlib.md5(f'{content_etag}:{count}:{total}:{csrf_secret}'.encode('utf-8')).hexdigest()
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapped
+    return decorator
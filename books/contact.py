@@ -0,0 +1,124 @@
+"""
+Buffered writes for contact form submissions.
+
+``submit_contact_message`` adds the message to an in-process buffer and
+returns straight away. A background thread flushes the buffer with a single
+``bulk_create`` once ``CONTACT_BUFFER_SIZE`` messages are waiting or every
+``CONTACT_FLUSH_INTERVAL`` seconds, and queues one notification email task
+for the whole batch (see ``books.tasks``).
+
+If the batch insert fails, the messages are saved one at a time and any
+that still fail are logged and dropped, so one bad row never holds up the
+rest. Messages still buffered when a process is killed without a normal
+exit are lost, so keep the flush interval short. Setting ``CONTACT_BUFFER_SIZE`` to
+1 writes every message immediately.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from taskqueue.queue import enqueue
+from .models import ContactMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+def _save(messages):
+    """Insert ``messages``, returning the ones that were saved"""
+    try:
+        with transaction.atomic():
+            ContactMessage.objects.bulk_create(messages)
+        return messages
+    except Exception:
+        logger.exception('Could not write %d contact messages at once, saving them one by one', len(messages))
+    saved = []
+    for message in messages:
+        try:
+            with transaction.atomic():
+                message.save()
+        except Exception:
+            logger.exception('Dropped contact message from %s', message.email)
+        else:
+            saved.append(message)
+    return saved
+
+
+def _write(messages):
+    """Save ``messages`` and queue their notification; returns how many were saved"""
+    messages = _save(messages)
+    if messages:
+        from . import tasks
+        enqueue(tasks.notify_contact_messages, messages=[
+            {
+                'name': message.name,
+                'email': message.email,
+                'subject': message.subject,
+                'message': message.message,
+            }
+            for message in messages
+        ])
+    return len(messages)
+
+
+class ContactMessageBuffer:
+    """Collects ``ContactMessage`` rows and writes them in batches"""
+
+    def __init__(self, max_size, interval):
+        self.max_size = max_size
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def add(self, message):
+        with self.lock:
+            self.pending.append(message)
+            full = len(self.pending) >= self.max_size
+            # Threads don't survive a fork, so each worker process of a
+            # preforking server starts its own flusher.
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name='contact-flusher', daemon=True)
+                self.thread.start()
+        if full:
+            self.wakeup.set()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not write buffered contact messages')
+
+    def flush(self):
+        """Write out everything buffered so far; returns the number of messages saved"""
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        return _write(batch)
+
+
+buffer = ContactMessageBuffer(
+    max_size=getattr(settings, 'CONTACT_BUFFER_SIZE', 50),
+    interval=getattr(settings, 'CONTACT_FLUSH_INTERVAL', 2.0),
+)
+atexit.register(buffer.flush)
+
+
+def submit_contact_message(name, email, subject, message):
+    message = ContactMessage(name=name, email=email, subject=subject, message=message)
+    if buffer.max_size <= 1:
+        _write([message])
+    else:
+        buffer.add(message)
@@ -1,13 +1,17 @@
-from decimal import Decimal
+from .cart import Cart
 
 
 def cart(request):
-    """Context processor to make cart available in all templates"""
-    cart = request.session.get('cart', {})
-    cart_count = sum(int(item['quantity']) for item in cart.values())
-    cart_total = sum(Decimal(item['price']) * int(item['quantity']) for item in cart.values())
+    """
+    Context processor to make cart available in all templates.
+    
+    The values are callables, which templates only evaluate when they
+    actually use ``cart_count``/``cart_total``; pages that don't show the
+    cart never look it up.
+    """
+    cart = Cart.for_request(request)
     
     return {
-        'cart_count': cart_count,
-        'cart_total': cart_total,
+        'cart_count': cart.count,
+        'cart_total': cart.total,
     }
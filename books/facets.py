@@ -0,0 +1,192 @@
+"""
+Faceted filtering for catalog listings (``book_list`` and ``BookViewSet``).
+
+Listings can be narrowed by any combination of the ``FACETS``: a category
+slug, an author, a price range and a stock level. Each facet lists its
+values with the number of books the listing would show with that value
+selected, i.e. counting the other facets' selections but not its own, so
+users can switch values as well as drill down.
+
+The counts are computed by the database with three queries over the
+available books matching the search query, each returning one row per value
+shown rather than per combination of values: a ``GROUP BY`` for categories,
+one for the most common authors, and a single row of conditional ``COUNT``s
+(``Count(filter=...)``) for the fixed price ranges and stock levels (and the
+selected author). Each facet's counts are filtered by the other facets'
+selections. The result for a search and selection is cached per catalog
+version (see ``books.cache``).
+"""
+import hashlib
+
+from django.db.models import Count, Q
+
+from .cache import _cached
+from .models import Book
+from .search import search_books
+
+
+FACETS = ('category', 'author', 'price', 'availability')
+
+# (key, label, lowest price, price it stays below)
+PRICE_RANGES = (
+    ('0-300', 'Under ₹300', None, 300),
+    ('300-500', '₹300 – ₹500', 300, 500),
+    ('500-750', '₹500 – ₹750', 500, 750),
+    ('750-', '₹750 and above', 750, None),
+)
+
+# Books with this many copies or fewer are "low on stock"
+LOW_STOCK = 5
+
+STOCK_LEVELS = (
+    ('in_stock', f'More than {LOW_STOCK} in stock'),
+    ('low_stock', f'{LOW_STOCK} or fewer left'),
+)
+
+# Authors listed, most books first (plus the selected one)
+AUTHOR_FACET_SIZE = 10
+
+
+def selected_facets(params):
+    """The facet selections in ``params`` (a ``QueryDict``), ignoring unknown values"""
+    selected = {}
+    for facet in FACETS:
+        value = (params.get(facet) or '').strip()
+        if not value:
+            continue
+        if facet == 'price' and value not in {key for key, *_ in PRICE_RANGES}:
+            continue
+        if facet == 'availability' and value not in dict(STOCK_LEVELS):
+            continue
+        selected[facet] = value
+    return selected
+
+
+def facet_filter(facet, value):
+    """``Q`` matching the books that have ``value`` for ``facet``"""
+    if facet == 'category':
+        return Q(category__slug=value)
+    if facet == 'author':
+        return Q(author=value)
+    if facet == 'price':
+        low, high = next((low, high) for key, _, low, high in PRICE_RANGES if key == value)
+        condition = Q()
+        if low is not None:
+            condition &= Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        return condition
+    if value == 'low_stock':
+        return Q(stock__lte=LOW_STOCK)
+    return Q(stock__gt=LOW_STOCK)
+
+
+def _other_selections(selected, facet):
+    """``Q`` for every selection in ``selected`` except ``facet``'s own"""
+    condition = Q()
+    for other, value in selected.items():
+        if other != facet:
+            condition &= facet_filter(other, value)
+    return condition
+
+
+def filter_books(books, selected):
+    """Narrow ``books`` to the ``selected`` facet values"""
+    for facet, value in selected.items():
+        books = books.filter(facet_filter(facet, value))
+    return books
+
+
+def compute_facet_counts(query=None, selected=None):
+    """
+    ``{'category': [(slug, name, count)], 'author': [(author, count)],
+    'price': {key: count}, 'availability': {key: count}}`` for the
+    available books matching ``query``, ignoring facet values no book has
+    (except a selected author)
+    """
+    selected = selected or {}
+    books = Book.objects.available()
+    if query:
+        books = search_books(books, query)
+    books = books.order_by()
+
+    # There are few categories, so they're sorted here rather than by the database
+    categories = sorted(
+        books.filter(_other_selections(selected, 'category'), category__isnull=False)
+        .values_list('category__slug', 'category__name')
+        .annotate(count=Count('id')),
+        key=lambda category: category[1],
+    )
+    authors = list(
+        books.filter(_other_selections(selected, 'author'))
+        .values_list('author')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'author')[:AUTHOR_FACET_SIZE]
+    )
+
+    # One conditional count per fixed value; aliases are positional since
+    # price range keys aren't valid column names
+    fixed = [('price', key) for key, *_ in PRICE_RANGES] + [('availability', key) for key, _ in STOCK_LEVELS]
+    if selected.get('author') and selected['author'] not in {author for author, _ in authors}:
+        fixed.append(('author', selected['author']))
+    totals = books.aggregate(**{
+        f'count_{index}': Count('id', filter=facet_filter(facet, value) & _other_selections(selected, facet))
+        for index, (facet, value) in enumerate(fixed)
+    })
+    counts = {'price': {}, 'availability': {}}
+    for index, (facet, value) in enumerate(fixed):
+        if facet == 'author':
+            authors.append((value, totals[f'count_{index}']))
+        else:
+            counts[facet][value] = totals[f'count_{index}']
+    return {'category': categories, 'author': authors, **counts}
+
+
+def get_facet_counts(query=None, selected=None):
+    key = '&'.join(f'{facet}={value}' for facet, value in sorted((selected or {}).items()))
+    digest = hashlib.md5(f'{query or ""}?{key}'.encode('utf-8')).hexdigest()
+    return _cached(f'facets:{digest}', lambda: compute_facet_counts(query, selected))
+
+
+def facet_counts(query=None, selected=None):
+    """
+    The values of each facet for the books matching ``query``, as
+    ``{facet: [{'value', 'label', 'count', 'selected'}, ...]}``. Values no
+    book has are left out unless selected.
+    """
+    selected = selected or {}
+    counts = get_facet_counts(query, selected)
+
+    def choices(facet, values):
+        return [
+            {'value': value, 'label': label, 'count': count, 'selected': selected.get(facet) == value}
+            for value, label, count in values
+            if count or selected.get(facet) == value
+        ]
+
+    return {
+        'category': choices('category', counts['category']),
+        'author': choices('author', [(author, author, count) for author, count in counts['author']]),
+        'price': choices('price', [(key, label, counts['price'][key]) for key, label, *_ in PRICE_RANGES]),
+        'availability': choices(
+            'availability', [(key, label, counts['availability'][key]) for key, label in STOCK_LEVELS],
+        ),
+    }
+
+
+def facet_links(facets, params):
+    """
+    Add the ``url`` of each facet value to ``facets``: the listing with the
+    value selected, or with the facet cleared if it already is
+    """
+    params = params.copy()
+    params.pop('cursor', None)
+    for facet, values in facets.items():
+        for value in values:
+            choice = params.copy()
+            if value['selected']:
+                choice.pop(facet, None)
+            else:
+                choice[facet] = value['value']
+            value['url'] = '?' + choice.urlencode()
+    return facets
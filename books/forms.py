@@ -0,0 +1,11 @@
+from django import forms
+
+from .models import ContactMessage
+
+
+class ContactForm(forms.ModelForm):
+    """Checks a contact submission against the model before it is buffered"""
+
+    class Meta:
+        model = ContactMessage
+        fields = ['name', 'email', 'subject', 'message']
@@ -0,0 +1,141 @@
+"""
+Responsive cover images.
+
+Book cards are a few hundred pixels wide, so serving the original upload
+wastes bandwidth. ``generate_renditions`` writes resized WebP and JPEG
+copies of a cover next to it in storage (``books/renditions/``), and the
+widths it produced are recorded in ``Book.image_renditions`` together with
+the name of the original they were made from. Rendition names keep the
+original's whole file name, extension included, so ``cover.jpg`` and
+``cover.png`` never share (or delete) each other's renditions.
+
+Renditions are generated off the request path by the
+``books.tasks.generate_book_renditions`` task whenever a cover changes, and
+``manage.py build_renditions`` backfills existing covers. Until they exist
+templates (``{% book_cover %}``) and the API (``image_srcset``) fall back to
+the original image.
+"""
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import Book
+
+
+# Pillow format and file extension for each rendition format
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+# Bumped when rendition names change; renditions recorded under an older
+# version are regenerated like those of a replaced cover
+VERSION = 2
+
+_storage = Book._meta.get_field('image').storage
+
+
+def rendition_widths():
+    return sorted(getattr(settings, 'BOOK_IMAGE_WIDTHS', (160, 320, 640)))
+
+
+def rendition_name(name, width, image_format, version=VERSION):
+    """Storage name of the ``width`` pixel wide ``image_format`` copy of ``name``"""
+    directory, filename = posixpath.split(name)
+    if version < 2:
+        filename = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'renditions', f'{filename}-{width}w.{FORMATS[image_format][1]}')
+
+
+def is_current(name, renditions):
+    """Whether ``renditions`` were made from the cover currently stored as ``name``"""
+    return (
+        bool(name) and bool(renditions)
+        and renditions.get('source') == name
+        and renditions.get('version', 1) == VERSION
+    )
+
+
+def generate_renditions(name, widths=None):
+    """
+    Write the renditions of the cover stored as ``name`` and return the
+    value for ``Book.image_renditions``. Covers are never upscaled; one
+    narrower than every configured width gets a single rendition at its
+    own size. Touches only storage, never the database, so it can run in a
+    separate process.
+    """
+    with _storage.open(name, 'rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            # JPEG has no alpha channel; flatten transparent covers onto white
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+
+    quality = getattr(settings, 'BOOK_IMAGE_QUALITY', 80)
+    widths = [w for w in (widths or rendition_widths()) if w < image.width] or [image.width]
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for image_format, (pillow_format, _) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, pillow_format, quality=quality, optimize=pillow_format == 'JPEG')
+            target = rendition_name(name, width, image_format)
+            # Storage.save() would pick a new name rather than overwrite
+            if _storage.exists(target):
+                _storage.delete(target)
+            _storage.save(target, ContentFile(buffer.getvalue()))
+    return {'source': name, 'widths': widths, 'version': VERSION}
+
+
+def delete_renditions(renditions):
+    """Remove the files described by a ``Book.image_renditions`` value"""
+    if not renditions:
+        return
+    version = renditions.get('version', 1)
+    for width in renditions['widths']:
+        for image_format in FORMATS:
+            target = rendition_name(renditions['source'], width, image_format, version)
+            if _storage.exists(target):
+                _storage.delete(target)
+
+
+def srcset(name, renditions, image_format, url=_storage.url):
+    """
+    ``srcset`` attribute value listing the ``image_format`` renditions of
+    ``name``, or ``''`` if they are missing or stale. ``url`` maps storage
+    names to URLs.
+    """
+    if not is_current(name, renditions):
+        return ''
+    return ', '.join(
+        f'{url(rendition_name(name, width, image_format))} {width}w'
+        for width in renditions['widths']
+    )
+
+
+def cover_url(name, renditions, width, url=_storage.url):
+    """
+    URL of the smallest JPEG rendition at least ``width`` pixels wide (the
+    largest one if none is), the original if there are no renditions, or
+    ``None`` for a book without a cover.
+    """
+    if not name:
+        return None
+    if not is_current(name, renditions):
+        return url(name)
+    widths = renditions['widths']
+    best = next((w for w in widths if w >= width), widths[-1])
+    return url(rendition_name(name, best, 'jpeg'))
+
+
+def srcsets(name, renditions, url=_storage.url):
+    """``{'webp': ..., 'jpeg': ...}`` for the API, or ``None`` without renditions"""
+    if not is_current(name, renditions):
+        return None
+    return {image_format: srcset(name, renditions, image_format, url) for image_format in FORMATS}
@@ -0,0 +1,431 @@
+"""
+Bulk catalog import.
+
+``CatalogImporter`` streams books from a CSV or JSON Lines file (optionally
+gzipped), validates them in chunks and upserts each chunk with a single
+``bulk_create(update_conflicts=True)``, so memory use stays flat for files
+of any size and re-importing a file updates books in place.
+
+A row updates the book whose slug it gives in its ``slug`` column, or else
+the book with the same title and author. New books get their title's slug,
+with a numeric suffix (and a logged warning) when another book already has
+it, so two different books never overwrite each other. Pass
+``update_existing=False`` to only add new books.
+
+Recognised fields: ``title``, ``author``, ``price`` (required),
+``description``, ``category`` (name), ``slug``, ``stock``, ``is_available``
+and ``image`` (an http(s) URL, or a path relative to ``image_root``).
+Cover images of a chunk are fetched concurrently by a bounded thread pool
+before the chunk is written, and resizing the new ones is left to the task
+queue (see ``books.images``). Covers are stored under a name derived from
+their source, so a cover is only fetched again when its source changes.
+
+After every committed chunk the byte offset reached is saved to a
+checkpoint file, which lets an interrupted import resume where it stopped.
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from django.utils.text import slugify
+
+from taskqueue.queue import enqueue_many
+from .images import is_current
+from .models import Book, Category
+from .stats import refresh_category_stats
+from .tasks import generate_book_renditions
+
+
+UPDATE_FIELDS = ['title', 'author', 'description', 'price', 'stock', 'is_available', 'category', 'updated_at']
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def free_slug(model, slug, taken, max_length):
+    """
+    ``slug`` with the lowest numeric suffix that no ``model`` row and no
+    slug in ``taken`` has
+    """
+    taken = taken | set(model.objects.filter(slug__startswith=f'{slug[:max_length - 4]}-').values_list('slug', flat=True))
+    number = 2
+    while True:
+        suffix = f'-{number}'
+        candidate = slug[:max_length - len(suffix)] + suffix
+        if candidate not in taken:
+            return candidate
+        number += 1
+
+
+def _open_binary(path):
+    return gzip.open(path, 'rb') if str(path).endswith('.gz') else open(path, 'rb')
+
+
+class CatalogReader:
+    """
+    Iterate the rows of a CSV or JSONL file as dicts, starting at byte
+    ``offset`` (with ``fieldnames`` taken from an earlier read for CSV).
+    After each row, ``self.offset`` is the byte position just past it.
+    """
+
+    def __init__(self, path, offset=0, fieldnames=None):
+        self.path = str(path)
+        self.offset = offset
+        self.fieldnames = fieldnames
+        name = self.path[:-3] if self.path.endswith('.gz') else self.path
+        self.format = 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    def _lines(self, handle):
+        handle.seek(self.offset)
+        for line in handle:
+            self.offset += len(line)
+            yield line.decode('utf-8-sig' if self.offset == len(line) else 'utf-8')
+
+    def __iter__(self):
+        with _open_binary(self.path) as handle:
+            lines = self._lines(handle)
+            if self.format == 'jsonl':
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+                return
+
+            reader = csv.reader(lines)
+            if self.fieldnames is None:
+                self.fieldnames = [name.strip() for name in next(reader, [])]
+            for values in reader:
+                if values:
+                    yield dict(zip(self.fieldnames, values))
+
+
+def clean_row(row):
+    """Validate a raw row and return the field values for a ``Book``"""
+    title = (row.get('title') or '').strip()
+    author = (row.get('author') or '').strip()
+    if not title or not author:
+        raise InvalidRow('title and author are required')
+    try:
+        price = Decimal(str(row.get('price', '')).strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise InvalidRow(f'invalid price {row.get("price")!r}')
+    if price < 0:
+        raise InvalidRow('price must not be negative')
+
+    stock = row.get('stock')
+    try:
+        stock = 1 if stock in (None, '') else int(stock)
+    except (TypeError, ValueError):
+        raise InvalidRow(f'invalid stock {stock!r}')
+    if stock < 0:
+        raise InvalidRow('stock must not be negative')
+
+    available = row.get('is_available')
+    if available in (None, ''):
+        available = True
+    elif not isinstance(available, bool):
+        available = str(available).strip().lower() in TRUE_VALUES
+
+    slug = slugify(row.get('slug') or '')[:200]
+    if not slug and not slugify(title):
+        raise InvalidRow('could not build a slug from the title')
+
+    return {
+        'title': title[:200],
+        # Only set when the row names the book it updates, see CatalogImporter.assign_slugs
+        'slug': slug,
+        'author': author[:100],
+        'description': (row.get('description') or '').strip(),
+        'price': price,
+        'stock': stock,
+        'is_available': available and stock > 0,
+        'category': (row.get('category') or '').strip()[:100],
+        'image': (row.get('image') or '').strip(),
+    }
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=1000, image_workers=8, image_root=None,
+                 checkpoint_path=None, log=None, update_existing=True):
+        self.chunk_size = chunk_size
+        self.image_workers = image_workers
+        self.image_root = Path(image_root) if image_root else None
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+        self.log = log or (lambda message: None)
+        self.update_existing = update_existing
+        self.categories = {}
+        self.rows = 0
+        self.processed = 0
+        self.imported = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.images = 0
+
+    # Checkpoints
+
+    def _source_id(self, path):
+        stat = os.stat(path)
+        return {'path': str(Path(path).resolve()), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def load_checkpoint(self, path):
+        """Return the saved checkpoint for ``path`` if it is still valid"""
+        if not self.checkpoint_path or not self.checkpoint_path.exists():
+            return None
+        state = json.loads(self.checkpoint_path.read_text())
+        if state.get('source') != self._source_id(path):
+            return None
+        return state
+
+    def save_checkpoint(self, path, reader):
+        if not self.checkpoint_path:
+            return
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            'source': self._source_id(path),
+            'offset': reader.offset,
+            'fieldnames': reader.fieldnames,
+            'rows': self.rows,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+        }
+        temporary = self.checkpoint_path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(state))
+        os.replace(temporary, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
+
+    # Importing
+
+    def run(self, path, resume=False):
+        """Import every row of ``path``; returns the elapsed time in seconds"""
+        state = self.load_checkpoint(path) if resume else None
+        if state:
+            self.rows, self.imported, self.invalid = state['rows'], state['imported'], state['invalid']
+            self.skipped = state.get('skipped', 0)
+            self.log(f'Resuming after row {self.rows}')
+            reader = CatalogReader(path, state['offset'], state['fieldnames'])
+        else:
+            reader = CatalogReader(path)
+
+        elapsed = self.import_rows(reader, on_chunk=lambda: self.save_checkpoint(path, reader))
+        self.clear_checkpoint()
+        return elapsed
+
+    def import_rows(self, rows, on_chunk=None):
+        """
+        Import an iterable of row dicts, calling ``on_chunk`` after each full
+        chunk is committed. Returns the elapsed time in seconds.
+        """
+        start = time.perf_counter()
+        chunk = []
+        with ThreadPoolExecutor(max_workers=self.image_workers) as pool:
+            self.pool = pool
+            for row in rows:
+                chunk.append((self.rows + 1, row))
+                self.rows += 1
+                self.processed += 1
+                if len(chunk) >= self.chunk_size:
+                    self.import_chunk(chunk)
+                    chunk = []
+                    if on_chunk:
+                        on_chunk()
+                    elapsed = time.perf_counter() - start
+                    self.log(f'{self.rows} rows, {self.processed / elapsed:.0f} rows/sec')
+            if chunk:
+                self.import_chunk(chunk)
+        # bulk_create skips the signals that keep these up to date
+        refresh_category_stats()
+        return time.perf_counter() - start
+
+    def import_chunk(self, chunk):
+        rows = {}
+        for number, row in chunk:
+            try:
+                values = clean_row(row)
+            except InvalidRow as exc:
+                self.invalid += 1
+                self.log(f'Row {number}: {exc}')
+                continue
+            # Later rows win when a book repeats within the chunk
+            rows[values['slug'] or (values['title'], values['author'])] = (number, values)
+
+        books = self.assign_slugs(rows.values())
+        if not books:
+            return
+        images = self.fetch_images(books.values())
+        with transaction.atomic():
+            categories = self.resolve_categories({b['category'] for b in books.values() if b['category']})
+            self.upsert(books.values(), categories)
+            if images:
+                self.set_images(images)
+                self.queue_renditions(images)
+        self.imported += len(books)
+        self.images += len(images)
+
+    def assign_slugs(self, rows):
+        """
+        Set the slug of each ``(row number, values)`` to that of the book it
+        updates, or to a free one for new books, and return the values keyed
+        by slug. Rows of existing books are dropped unless
+        ``update_existing`` is set.
+        """
+        by_name = [values for _, values in rows if not values['slug']]
+        existing = {}
+        if by_name:
+            existing.update(
+                ((title, author), slug) for title, author, slug in
+                Book.objects.filter(title__in={values['title'] for values in by_name})
+                .values_list('title', 'author', 'slug')
+            )
+        wanted = {values['slug'] or slugify(values['title'])[:200] for _, values in rows}
+        taken = set(Book.objects.filter(slug__in=wanted).values_list('slug', flat=True))
+
+        books = {}
+        for number, values in sorted(rows, key=lambda row: not row[1]['slug']):
+            if values['slug']:
+                is_new = values['slug'] not in taken
+            elif (values['title'], values['author']) in existing:
+                values['slug'] = existing[values['title'], values['author']]
+                is_new = False
+            else:
+                slug = slugify(values['title'])[:200]
+                if slug in taken or slug in books:
+                    values['slug'] = free_slug(Book, slug, taken | set(books), 200)
+                    self.log(f'Row {number}: slug "{slug}" belongs to another book, using "{values["slug"]}"')
+                else:
+                    values['slug'] = slug
+                is_new = True
+            if not (is_new or self.update_existing):
+                self.skipped += 1
+                continue
+            books[values['slug']] = values
+        return books
+
+    def resolve_categories(self, names):
+        """Map category names to ids, creating missing categories in bulk"""
+        missing = names - self.categories.keys()
+        if missing:
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+            missing -= self.categories.keys()
+        if missing:
+            slugs = {name: slugify(name)[:100] or 'category' for name in missing}
+            taken = set(Category.objects.filter(slug__in=slugs.values()).values_list('slug', flat=True))
+            objects = []
+            for name in sorted(missing):
+                slug = slugs[name]
+                if slug in taken:
+                    slug = free_slug(Category, slug, taken, 100)
+                    self.log(f'Category {name}: slug "{slugs[name]}" belongs to another category, using "{slug}"')
+                taken.add(slug)
+                objects.append(Category(name=name, slug=slug))
+            # Another import may have added some of them meanwhile
+            Category.objects.bulk_create(objects, ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'id'))
+            for name in sorted(missing - self.categories.keys()):
+                self.log(f'Category {name}: could not be created, its books are left uncategorised')
+        return self.categories
+
+    def upsert(self, books, categories):
+        now = timezone.now()
+        objects = [
+            Book(
+                title=b['title'], slug=b['slug'], author=b['author'],
+                description=b['description'], price=b['price'], stock=b['stock'],
+                is_available=b['is_available'], category_id=categories.get(b['category']),
+                created_at=now, updated_at=now,
+            )
+            for b in books
+        ]
+        options = {'update_conflicts': True, 'update_fields': UPDATE_FIELDS}
+        # MySQL's ON DUPLICATE KEY UPDATE doesn't take a conflict target
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['slug']
+        Book.objects.bulk_create(objects, **options)
+
+    def set_images(self, images):
+        # Images are set separately so a failed download never blanks the
+        # cover of a book that is being re-imported.
+        Book.objects.filter(slug__in=images).update(image=Case(
+            *[When(slug=slug, then=Value(name)) for slug, name in images.items()]
+        ))
+
+    def queue_renditions(self, images):
+        rows = Book.objects.filter(slug__in=images).values_list('id', 'image', 'image_renditions')
+        calls = [
+            (generate_book_renditions, {'book_id': book_id})
+            for book_id, name, renditions in rows if not is_current(name, renditions)
+        ]
+        if calls:
+            enqueue_many(calls)
+
+    # Cover images
+
+    def fetch_images(self, books):
+        """Fetch the chunk's cover images concurrently; returns ``{slug: name}``"""
+        jobs = {
+            b['slug']: self.pool.submit(self.fetch_image, b['slug'], b['image'])
+            for b in books if b['image']
+        }
+        images = {}
+        for slug, future in jobs.items():
+            try:
+                images[slug] = future.result()
+            except (OSError, ValueError) as exc:
+                self.log(f'Image for {slug}: {exc}')
+        return images
+
+    def fetch_image(self, slug, source):
+        """
+        Copy or download one cover into MEDIA_ROOT and return its name. The
+        name includes a hash of the URL (or of the local file's path, size
+        and modification time), so an existing file is only reused when it
+        came from the same source.
+        """
+        extension = os.path.splitext(source.split('?')[0])[1].lower()
+        if extension not in IMAGE_EXTENSIONS:
+            extension = '.jpg'
+        remote = source.startswith(('http://', 'https://'))
+        if remote:
+            origin = source
+        else:
+            path = Path(source)
+            if not path.is_absolute():
+                if self.image_root is None:
+                    raise ValueError(f'relative image path {source!r} needs an image root')
+                path = self.image_root / path
+            stat = path.stat()
+            origin = f'{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}'
+        digest = hashlib.md5(origin.encode('utf-8')).hexdigest()[:8]
+        name = f'{Book._meta.get_field("image").upload_to}{slug}-{digest}{extension}'
+        destination = Path(settings.MEDIA_ROOT) / name
+        if destination.exists():
+            return name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        temporary = destination.with_name(destination.name + '.part')
+
+        if remote:
+            with urllib.request.urlopen(source, timeout=30) as response, open(temporary, 'wb') as out:
+                shutil.copyfileobj(response, out)
+        else:
+            shutil.copyfile(path, temporary)
+        os.replace(temporary, destination)
+        return name
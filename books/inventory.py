@@ -0,0 +1,102 @@
+"""
+Stock keeping for books.
+
+Each ``Book`` has a ``stock`` count. Adding a book to a cart reserves copies
+for that session for ``CART_RESERVATION_MINUTES``, so other shoppers can't
+put the last copy in their cart too. Reserving locks the book's row for
+the moment it takes to check and write the reservation, so two shoppers
+can't both take the last free copy. Reservations only gate adding to
+carts; the sale itself goes through ``consume_stock``, a single conditional
+``UPDATE`` that decrements every purchased book only if enough stock is
+left. Concurrent checkouts therefore can never oversell, and none of them
+has to lock rows ahead of time.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+
+from .models import Book, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, book, available):
+        self.book = book
+        self.available = available
+        if available:
+            message = f'Only {available} of "{book.title}" left in stock'
+        else:
+            message = f'"{book.title}" is out of stock'
+        super().__init__(message)
+
+
+def reservation_expiry():
+    minutes = getattr(settings, 'CART_RESERVATION_MINUTES', 15)
+    return timezone.now() + timedelta(minutes=minutes)
+
+
+def reserved_by_others(book, session_key):
+    """Copies of ``book`` held in other shoppers' unexpired reservations"""
+    return StockReservation.objects.filter(
+        book=book, expires_at__gt=timezone.now()
+    ).exclude(session_key=session_key).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def reserve(book, session_key, quantity):
+    """
+    Hold ``quantity`` copies of ``book`` for ``session_key`` (replacing any
+    earlier reservation). Raises ``OutOfStock`` if that many aren't free.
+    """
+    if quantity < 1:
+        raise ValueError(f'Cannot reserve {quantity} copies')
+    with transaction.atomic():
+        # Concurrent reservations of the same book wait here until this one
+        # is written, so they see it when counting what is left.
+        stock = Book.objects.select_for_update().values_list('stock', flat=True).get(id=book.id)
+        available = stock - reserved_by_others(book, session_key)
+        if quantity > available:
+            raise OutOfStock(book, max(available, 0))
+        StockReservation.objects.update_or_create(
+            book=book,
+            session_key=session_key,
+            defaults={'quantity': quantity, 'expires_at': reservation_expiry()},
+        )
+
+
+def release(session_key, book_ids=None):
+    """Drop the session's reservations (for ``book_ids`` only, if given)"""
+    reservations = StockReservation.objects.filter(session_key=session_key)
+    if book_ids is not None:
+        reservations = reservations.filter(book_id__in=book_ids)
+    reservations.delete()
+
+
+def release_expired():
+    deleted, _ = StockReservation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def consume_stock(quantities):
+    """
+    Decrement stock for ``{book_id: quantity}`` in one statement, only if
+    every book still has enough. Returns ``False`` when another checkout got
+    there first and at least one book fell short; the caller must then roll
+    back its transaction, since the other rows were already decremented.
+    """
+    wanted = Case(
+        *[When(id=book_id, then=quantity) for book_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = Book.objects.filter(
+        id__in=quantities, is_available=True, stock__gte=wanted
+    ).update(stock=F('stock') - wanted, updated_at=timezone.now())
+    return updated == len(quantities)
+
+
+def mark_sold_out(book_ids):
+    """Flag books among ``book_ids`` that have no stock left as unavailable"""
+    return Book.objects.filter(id__in=book_ids, stock=0, is_available=True).update(
+        is_available=False, updated_at=timezone.now(),
+    )
@@ -0,0 +1,473 @@
+"""
+In-process inverted index search engine for the book catalog.
+
+The index tokenizes and stems ``Book.title``, ``author`` and ``description``
+into postings lists of book ids (compact ``array('I')`` buffers) and ranks
+matches with BM25, so catalog searches are answered from memory without a
+database round trip. Each worker keeps its own copy, loaded from a
+memory-mapped index file written by ``manage.py rebuild_search_index``.
+``Book`` saves and deletes are applied to the worker that made them right
+away (via signals) and queue a rewrite of the index file, which the other
+workers pick up on their next search. The rewrite (``save_index``) brings
+the task worker's copy up to date with the books changed since it was
+built rather than re-reading the whole catalog.
+
+Enable it with::
+
+    BOOK_SEARCH_BACKEND = 'books.inverted_index.InvertedIndexSearchBackend'
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, FloatField, Value, When
+from django.utils import timezone
+
+from .models import Book
+from .search import BookSearchBackend, tokenize
+
+
+MAGIC = b'BKIX2\n'
+
+# Field boosts applied to term frequencies (a simplified BM25F)
+FIELD_WEIGHTS = {
+    'title': 3,
+    'author': 2,
+    'description': 1,
+}
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'with',
+])
+
+SUFFIXES = (
+    'ational', 'tional', 'ations', 'ation', 'ness', 'ment', 'ings', 'ing',
+    'edly', 'ies', 'ied', 'ed', 'ly', 'es', 's',
+)
+
+
+def stem(word):
+    """Light suffix-stripping stemmer (``dragons`` -> ``dragon``)"""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix in SUFFIXES:
+        if not word.endswith(suffix) or len(word) - len(suffix) < 3:
+            continue
+        if suffix == 's' and word.endswith('ss'):
+            break
+        word = word[:-len(suffix)]
+        if suffix in ('ies', 'ied'):
+            return word + 'y'
+        break
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'lsz':
+        word = word[:-1]
+    elif len(word) > 4 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+
+def index_words(text):
+    """Tokenize ``text`` and drop stopwords"""
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def analyze(text):
+    """Tokenize, drop stopwords and stem ``text``"""
+    return [stem(word) for word in index_words(text)]
+
+
+def document_terms(book, words=None):
+    """
+    Return ``{term: weighted frequency}`` for a book, recording the term
+    each of its words was stemmed to in ``words``
+    """
+    frequencies = defaultdict(int)
+    for field, weight in FIELD_WEIGHTS.items():
+        for word in index_words(getattr(book, field) or ''):
+            term = stem(word)
+            frequencies[term] += weight
+            if words is not None:
+                words[word] = term
+    return frequencies
+
+
+class InvertedIndex:
+    """
+    Term -> postings map with BM25 ranking.
+
+    Postings for a term are two parallel buffers sorted by book id: the ids
+    and their weighted term frequencies. Buffers loaded from disk are
+    read-only ``memoryview``s over the mapped file and are copied into
+    ``array('I')`` the first time the term is modified.
+
+    Each book's terms are kept too (as numbers into ``vocabulary``), so
+    removing a book only touches its own postings, and so are the unstemmed
+    words each term came from, which prefix matches run against.
+    """
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = {}
+        self.doc_lengths = {}
+        self.doc_terms = {}     # book id -> term numbers
+        self.vocabulary = []    # term number -> term
+        self.term_ids = {}      # term -> term number
+        self.words = {}         # unstemmed word -> term
+        self.total_length = 0
+        # When the books it holds were read; later changes are picked up by save_index()
+        self.built_at = None
+        self._sorted_words = None
+        self._mmap = None
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    # Building and incremental updates
+
+    @classmethod
+    def build(cls, books):
+        """Build an index from an iterable of ``Book`` rows"""
+        index = cls()
+        index.built_at = timezone.now()
+        collected = defaultdict(lambda: (array('I'), array('I')))
+        for book in books:
+            terms = document_terms(book, index.words)
+            for term, frequency in terms.items():
+                ids, frequencies = collected[term]
+                ids.append(book.id)
+                frequencies.append(frequency)
+            index.doc_terms[book.id] = array('I', map(index._term_id, terms))
+            length = sum(terms.values())
+            index.doc_lengths[book.id] = length
+            index.total_length += length
+
+        for term, (ids, frequencies) in collected.items():
+            if any(ids[i] > ids[i + 1] for i in range(len(ids) - 1)):
+                order = sorted(range(len(ids)), key=ids.__getitem__)
+                ids = array('I', (ids[i] for i in order))
+                frequencies = array('I', (frequencies[i] for i in order))
+            index.postings[term] = [ids, frequencies]
+        return index
+
+    def add(self, book):
+        """Index ``book``, replacing any previous version of it"""
+        with self.lock:
+            self.remove(book.id)
+            words = {}
+            terms = document_terms(book, words)
+            for term, frequency in terms.items():
+                ids, frequencies = self._writable(term)
+                position = bisect_left(ids, book.id)
+                ids.insert(position, book.id)
+                frequencies.insert(position, frequency)
+            self.doc_terms[book.id] = array('I', map(self._term_id, terms))
+            length = sum(terms.values())
+            self.doc_lengths[book.id] = length
+            self.total_length += length
+            if words.keys() - self.words.keys():
+                self._sorted_words = None
+            self.words.update(words)
+
+    def remove(self, book_id):
+        """Drop ``book_id`` from the postings lists of its terms"""
+        with self.lock:
+            length = self.doc_lengths.pop(book_id, None)
+            if length is None:
+                return
+            self.total_length -= length
+            for term_id in self.doc_terms.pop(book_id, ()):
+                term = self.vocabulary[term_id]
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                position = bisect_left(entry[0], book_id)
+                if position < len(entry[0]) and entry[0][position] == book_id:
+                    ids, frequencies = self._writable(term)
+                    del ids[position]
+                    del frequencies[position]
+                    if not ids:
+                        del self.postings[term]
+
+    def _term_id(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.vocabulary)
+            self.vocabulary.append(term)
+        return term_id
+
+    def _writable(self, term):
+        entry = self.postings.get(term)
+        if entry is None:
+            entry = self.postings[term] = [array('I'), array('I')]
+        elif not isinstance(entry[0], array):
+            entry[0] = array('I', entry[0])
+            entry[1] = array('I', entry[1])
+        return entry
+
+    # Querying
+
+    def expand(self, prefix):
+        """
+        Return the terms of indexed words starting with ``prefix`` (before
+        stemming, so ``runnin`` finds ``run``), and the stem of ``prefix``
+        """
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self.words)
+        words = self._sorted_words
+        position = bisect_left(words, prefix)
+        matches = {stem(prefix)}
+        while position < len(words) and words[position].startswith(prefix):
+            matches.add(self.words[words[position]])
+            position += 1
+        return matches
+
+    def search(self, query, limit=None):
+        """
+        Return ``[(book_id, score), ...]`` for books matching every query
+        term, best first. The last term is treated as a prefix so partially
+        typed words match.
+        """
+        words = index_words(query)
+        if not words or not self.doc_lengths:
+            return []
+
+        with self.lock:
+            document_count = len(self.doc_lengths)
+            average_length = self.total_length / document_count
+            scores = None
+
+            for position, word in enumerate(words):
+                is_last = position == len(words) - 1
+                candidates = self.expand(word) if is_last else [stem(word)]
+                term_scores = defaultdict(float)
+                for candidate in candidates:
+                    entry = self.postings.get(candidate)
+                    if entry is None:
+                        continue
+                    ids, frequencies = entry
+                    idf = math.log(1 + (document_count - len(ids) + 0.5) / (len(ids) + 0.5))
+                    for book_id, frequency in zip(ids, frequencies):
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[book_id] / average_length)
+                        term_scores[book_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        book_id: score + term_scores[book_id]
+                        for book_id, score in scores.items()
+                        if book_id in term_scores
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    # Persistence
+
+    def save(self, path):
+        """Write the index to ``path`` atomically"""
+        with self.lock:
+            terms = []
+            chunks = []
+            offset = 0
+            for term in self.vocabulary:
+                ids, frequencies = self.postings.get(term, ((), ()))
+                terms.append([term, offset, len(ids)])
+                chunks.append(array('I', ids).tobytes())
+                chunks.append(array('I', frequencies).tobytes())
+                offset += 8 * len(ids)
+
+            doc_ids = array('I', self.doc_lengths.keys())
+            doc_lengths = array('I', self.doc_lengths.values())
+            doc_term_counts = array('I', (len(self.doc_terms[book_id]) for book_id in doc_ids))
+            header = json.dumps({
+                'terms': terms,
+                'documents': [offset, len(doc_ids)],
+                'doc_terms': [offset + 12 * len(doc_ids), sum(doc_term_counts)],
+                'words': self.words,
+                'total_length': self.total_length,
+                'built_at': self.built_at.isoformat() if self.built_at else None,
+            }).encode('utf-8')
+            chunks.append(doc_ids.tobytes())
+            chunks.append(doc_lengths.tobytes())
+            chunks.append(doc_term_counts.tobytes())
+            chunks.extend(array('I', self.doc_terms[book_id]).tobytes() for book_id in doc_ids)
+
+        # Pad the header so the payload starts on a 4-byte boundary
+        prefix_size = len(MAGIC) + 8 + len(header)
+        header += b' ' * (-prefix_size % 4)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as handle:
+            handle.write(MAGIC)
+            handle.write(struct.pack('<Q', len(header)))
+            handle.write(header)
+            for chunk in chunks:
+                handle.write(chunk)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by ``save()`` without copying postings"""
+        with open(path, 'rb') as handle:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mapped[:len(MAGIC)] != MAGIC:
+            mapped.close()
+            raise ValueError(f'{path} is not a book search index')
+        header_start = len(MAGIC) + 8
+        (header_size,) = struct.unpack('<Q', mapped[len(MAGIC):header_start])
+        header = json.loads(mapped[header_start:header_start + header_size])
+        payload = memoryview(mapped)[header_start + header_size:]
+
+        def view(offset, count):
+            return payload[offset:offset + 4 * count].cast('I')
+
+        index = cls()
+        index._mmap = mapped
+        for term, offset, count in header['terms']:
+            index.term_ids[term] = len(index.vocabulary)
+            index.vocabulary.append(term)
+            if count:
+                index.postings[term] = [view(offset, count), view(offset + 4 * count, count)]
+        offset, count = header['documents']
+        doc_ids = view(offset, count)
+        index.doc_lengths = dict(zip(doc_ids, view(offset + 4 * count, count)))
+        offset = header['doc_terms'][0]
+        for book_id, term_count in zip(doc_ids, view(offset - 4 * count, count)):
+            index.doc_terms[book_id] = view(offset, term_count)
+            offset += 4 * term_count
+        index.words = header['words']
+        index.total_length = header['total_length']
+        if header.get('built_at'):
+            index.built_at = datetime.fromisoformat(header['built_at'])
+        return index
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def index_path():
+    return getattr(settings, 'BOOK_SEARCH_INDEX_PATH', None) or os.path.join(settings.BASE_DIR, 'var', 'books.idx')
+
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_index():
+    """
+    Return this worker's index, loading it on first use and reloading it
+    whenever another process has written a newer index file.
+    """
+    global _index, _index_mtime
+    path = index_path()
+    mtime = _file_mtime(path)
+    if _index is not None and mtime == _index_mtime:
+        return _index
+
+    with _index_lock:
+        mtime = _file_mtime(path)
+        if _index is None or mtime != _index_mtime:
+            try:
+                _index = InvertedIndex.load(path) if mtime is not None else None
+            except ValueError:
+                # Written by an older version; replaced by the next rebuild
+                _index = None
+            if _index is None:
+                _index = InvertedIndex.build(Book.objects.only(*FIELD_WEIGHTS).iterator())
+            _index_mtime = mtime
+    return _index
+
+
+def get_loaded_index():
+    """Return the index if this worker has loaded one, without loading it"""
+    return _index
+
+
+def rebuild_index():
+    """Rebuild the index from the database and write it to disk"""
+    global _index, _index_mtime
+    index = InvertedIndex.build(Book.objects.only(*FIELD_WEIGHTS).iterator(chunk_size=2000))
+    path = index_path()
+    index.save(path)
+    with _index_lock:
+        _index = index
+        _index_mtime = _file_mtime(path)
+    return index
+
+
+def save_index():
+    """
+    Apply the books saved or deleted since this process's index was built
+    (possibly by other processes) and write it to disk. Only changed books
+    are read; an index without a build time is rebuilt instead.
+    """
+    global _index_mtime
+    index = get_index()
+    if index.built_at is None:
+        return rebuild_index()
+
+    started = timezone.now()
+    changed = Book.objects.filter(updated_at__gte=index.built_at).only(*FIELD_WEIGHTS)
+    for book in changed.iterator(chunk_size=2000):
+        index.add(book)
+    deleted = index.doc_lengths.keys() - set(Book.objects.values_list('id', flat=True).iterator(chunk_size=10000))
+    for book_id in deleted:
+        index.remove(book_id)
+    index.built_at = started
+
+    path = index_path()
+    index.save(path)
+    with _index_lock:
+        if _index is index:
+            _index_mtime = _file_mtime(path)
+    return index
+
+
+class InvertedIndexSearchBackend(BookSearchBackend):
+    """
+    Search backend answering queries from the in-process index. The index
+    holds every book, so when a query matches more than
+    ``BOOK_SEARCH_MAX_RESULTS`` of them the matches are first narrowed to
+    the ones in ``queryset`` (e.g. available books of a category), and only
+    then cut to the best ``BOOK_SEARCH_MAX_RESULTS``.
+    """
+    def search(self, queryset, query):
+        limit = getattr(settings, 'BOOK_SEARCH_MAX_RESULTS', 500)
+        ranked = get_index().search(query)
+        if len(ranked) > limit:
+            candidates = set(queryset.order_by().values_list('id', flat=True).iterator(chunk_size=10000))
+            ranked = [(book_id, score) for book_id, score in ranked if book_id in candidates][:limit]
+        if not ranked:
+            return queryset.none()
+
+        relevance = Case(
+            *[When(id=book_id, then=Value(score)) for book_id, score in ranked],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        queryset = queryset.filter(id__in=[book_id for book_id, _ in ranked])
+        return self.order_by_relevance(queryset.annotate(relevance=relevance))
+
+    def rebuild(self):
+        rebuild_index()
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from books.fast_serializers import BOOK_LIST_COLUMNS, book_values, serialize_book_list, serialize_books
+from books.models import Book, Category
+from books.renderers import FastJSONRenderer
+from books.serializers import BookListSerializer, BookSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF serializers with the fast .values() path (output must match; nothing is kept)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000, result
+
+    def handle(self, *args, **options):
+        request = APIRequestFactory().get('/api/books/')
+        self.stdout.write(
+            f'{"serializer":<16} {"rows":>7} {"DRF ms":>9} {"fast ms":>9} {"speedup":>8}'
+        )
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    category = Category.objects.create(name=f'Benchmark {size}', slug=f'benchmark-{size}')
+                    Book.objects.bulk_create([
+                        Book(
+                            title=f'Benchmark book {i}',
+                            slug=f'benchmark-serializer-{size}-{i}',
+                            author='Benchmark',
+                            description='Serializer benchmark ' * 5,
+                            price=100 + i % 900,
+                            image=f'books/benchmark-{i}.jpg' if i % 2 else '',
+                            image_renditions=(
+                                {'source': f'books/benchmark-{i}.jpg', 'widths': [160, 320]} if i % 4 == 1 else {}
+                            ),
+                            category=category if i % 10 else None,
+                        )
+                        for i in range(size)
+                    ])
+                    queryset = Book.objects.filter(
+                        slug__startswith=f'benchmark-serializer-{size}-'
+                    ).select_related('category').order_by('id')
+
+                    cases = [
+                        (
+                            'BookSerializer',
+                            lambda: BookSerializer(queryset, many=True, context={'request': request}).data,
+                            lambda: serialize_books(book_values(queryset), request),
+                        ),
+                        (
+                            'BookList',
+                            lambda: BookListSerializer(queryset, many=True).data,
+                            lambda: serialize_book_list(book_values(queryset, BOOK_LIST_COLUMNS)),
+                        ),
+                    ]
+                    for name, slow, fast in cases:
+                        slow_ms, slow_body = self.best_of(
+                            options['repeat'], lambda: JSONRenderer().render(slow()),
+                        )
+                        fast_ms, fast_body = self.best_of(
+                            options['repeat'], lambda: FastJSONRenderer().render(fast()),
+                        )
+                        if slow_body != fast_body:
+                            raise CommandError(f'{name}: fast path output differs from DRF')
+                        self.stdout.write(
+                            f'{name:<16} {size:>7} {slow_ms:>9.1f} {fast_ms:>9.1f} {slow_ms / fast_ms:>7.1f}x'
+                        )
+                    raise Rollback
+            except Rollback:
+                pass
+        self.stdout.write(self.style.SUCCESS('Fast path output is identical to DRF'))
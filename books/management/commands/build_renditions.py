@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from books.cache import bump_catalog_version
+from books.images import delete_renditions, generate_renditions, is_current
+from books.models import Book
+
+
+def render(job):
+    # Runs in a pool process; only touches storage
+    book_id, name = job
+    try:
+        return book_id, name, generate_renditions(name), None
+    except Exception as exc:
+        return book_id, name, None, f'{type(exc).__name__}: {exc}'
+
+
+def write_batch(batch, previous):
+    """
+    Store ``{book_id: (name, renditions)}`` for the books whose cover is
+    still ``name``, and delete the renditions they replace. Returns how
+    many were written; covers replaced meanwhile are left to the task their
+    change queued.
+    """
+    with transaction.atomic():
+        current = dict(
+            Book.objects.select_for_update().filter(id__in=batch).values_list('id', 'image')
+        )
+        now = timezone.now()
+        books = [
+            Book(id=book_id, image_renditions=renditions, updated_at=now)
+            for book_id, (name, renditions) in batch.items() if current.get(book_id) == name
+        ]
+        Book.objects.bulk_update(books, ['image_renditions', 'updated_at'])
+    for book_id, (name, renditions) in batch.items():
+        old = previous[book_id]
+        if current.get(book_id) != name:
+            # Made for a cover that is gone
+            delete_renditions(renditions)
+        elif old and not is_current(name, old):
+            delete_renditions(old)
+    return len(books)
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or stale cover renditions in a process pool (see books.images)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help='Number of resizing processes')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Books written back per UPDATE batch')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that are already up to date')
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(image='').exclude(image__isnull=True)
+        previous = {}
+        jobs = []
+        for book_id, name, renditions in books.values_list('id', 'image', 'image_renditions').iterator():
+            if options['force'] or not is_current(name, renditions):
+                previous[book_id] = renditions
+                jobs.append((book_id, name))
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('All covers are up to date'))
+            return
+
+        self.stdout.write(f'Resizing {len(jobs)} covers with {options["workers"]} processes...')
+        start = time.perf_counter()
+        done = failed = skipped = 0
+        batch = {}
+        # Forked processes must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1), mp_context=context) as pool:
+            for book_id, name, renditions, error in pool.map(render, jobs, chunksize=8):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Book {book_id} ({name}): {error}')
+                    continue
+                batch[book_id] = (name, renditions)
+                if len(batch) >= options['batch_size']:
+                    written = write_batch(batch, previous)
+                    done += written
+                    skipped += len(batch) - written
+                    batch = {}
+                    self.stdout.write(f'{done} covers, {done / (time.perf_counter() - start):.1f} covers/sec')
+        if batch:
+            written = write_batch(batch, previous)
+            done += written
+            skipped += len(batch) - written
+        bump_catalog_version()
+
+        elapsed = time.perf_counter() - start
+        message = f'Resized {done} covers in {elapsed:.1f}s'
+        if failed:
+            message += f' ({failed} failed)'
+        if skipped:
+            message += f' ({skipped} covers changed while running, left to the task queue)'
+        self.stdout.write(self.style.SUCCESS(message))
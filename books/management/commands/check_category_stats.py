@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from books.cache import bump_catalog_version
+from books.models import CategoryStats
+from books.stats import FIELDS, compute_category_stats, save_category_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare the denormalized category stats with the books table and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report drift (and fail if there is any)')
+
+    def handle(self, *args, **options):
+        fresh = compute_category_stats()
+        stored = {
+            row.pop('category_id'): row
+            for row in CategoryStats.objects.values('category_id', *FIELDS)
+        }
+
+        drifted = {}
+        for category_id, values in fresh.items():
+            current = stored.get(category_id)
+            if current == values:
+                continue
+            drifted[category_id] = values
+            if current is None:
+                self.stdout.write(f'Category {category_id}: no stats row')
+                continue
+            for field in FIELDS:
+                if current[field] != values[field]:
+                    self.stdout.write(
+                        f'Category {category_id}: {field} is {current[field]}, should be {values[field]}'
+                    )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f'Stats of all {len(fresh)} categories are consistent'))
+        elif options['dry_run']:
+            raise CommandError(f'Stats of {len(drifted)} categories have drifted')
+        else:
+            save_category_stats(drifted)
+            bump_catalog_version()
+            self.stdout.write(self.style.SUCCESS(f'Repaired the stats of {len(drifted)} categories'))
@@ -0,0 +1,115 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from books.models import Book, Category, CategoryStats, RelatedBook
+from bookstore.db_router import PIN_COOKIE, PRIMARY, ReplicaRouter
+
+
+CATALOG_TABLES = [model._meta.db_table for model in (Book, Category, CategoryStats, RelatedBook)]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that catalog reads go to the read replicas (round-robin, skipping lagging ones) '
+        'and that clients which wrote are pinned to the primary. Writes are rolled back.'
+    )
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas:
+            raise CommandError('No read replicas configured (set DB_REPLICAS)')
+        replica_router = next((r for r in router.routers if isinstance(r, ReplicaRouter)), None)
+        if replica_router is None:
+            raise CommandError('bookstore.db_router.ReplicaRouter is not in DATABASE_ROUTERS')
+
+        setup_test_environment()
+        book = Book.objects.available().filter(stock__gt=0).first()
+        if book is None:
+            raise CommandError('Load some books first (manage.py load_sample_data)')
+        pages = [
+            reverse('books:home'),
+            reverse('books:book_list'),
+            reverse('books:book_detail', kwargs={'slug': book.slug}),
+            reverse('books:search_books') + f'?q={book.title.split()[0]}',
+            reverse('book-list'),
+            reverse('search-books-api') + f'?q={book.title.split()[0]}',
+        ]
+
+        self.failures = []
+        try:
+            with transaction.atomic():
+                self.check_routing(replica_router, replicas, pages, book)
+                raise Rollback
+        except Rollback:
+            pass
+        if self.failures:
+            raise CommandError(f'{len(self.failures)} routing checks failed:\n' + '\n'.join(self.failures))
+        self.stdout.write(self.style.SUCCESS('Catalog reads are routed to the replicas'))
+
+    def catalog_reads(self, client, url, method='get', **data):
+        """``(response, {alias: catalog queries})`` for one request"""
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in connections
+            }
+            response = getattr(client, method)(url, data, HTTP_ACCEPT='application/json,text/html')
+        reads = {}
+        for alias, queries in captured.items():
+            names = [connections[alias].ops.quote_name(table) for table in CATALOG_TABLES]
+            count = sum(
+                1 for query in queries.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT') and any(name in query['sql'] for name in names)
+            )
+            if count:
+                reads[alias] = count
+        return response, reads
+
+    def expect(self, name, reads, allowed):
+        stray = {alias: count for alias, count in reads.items() if alias not in allowed}
+        status = self.style.ERROR('FAIL') if stray else self.style.SUCCESS('ok')
+        self.stdout.write(f'{status:<4} {name:<40} {reads or "no catalog queries"}')
+        if stray:
+            self.failures.append(f'{name}: catalog reads on {", ".join(stray)}')
+
+    def check_routing(self, replica_router, replicas, pages, book):
+        client = Client()
+        # Fill the catalog cache first (from the primary) so only reads
+        # that bypass it are measured
+        for url in pages:
+            client.get(url)
+        used = set()
+        for url in pages:
+            _, reads = self.catalog_reads(client, url)
+            used.update(reads)
+            self.expect(f'GET {url}', reads, replicas)
+        for alias in replicas:
+            if alias not in used:
+                self.failures.append(f'{alias} served no catalog reads (round-robin)')
+
+        # Replicas that fail their lag check are skipped
+        replica_router.health = {alias: (float('inf'), False) for alias in replicas}
+        try:
+            _, reads = self.catalog_reads(client, pages[1])
+            self.expect(f'GET {pages[1]} (replicas lagging)', reads, [PRIMARY])
+        finally:
+            replica_router.health = {}
+
+        # A client that wrote reads from the primary
+        response, reads = self.catalog_reads(client, reverse('books:add_to_cart'), 'post', book_id=book.id)
+        self.expect(f'POST {reverse("books:add_to_cart")}', reads, [PRIMARY])
+        if PIN_COOKIE not in response.cookies:
+            self.failures.append('adding to the cart did not pin the client to the primary')
+        for url in pages[1:3]:
+            _, reads = self.catalog_reads(client, url)
+            self.expect(f'GET {url} (pinned)', reads, [PRIMARY])
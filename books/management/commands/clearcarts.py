@@ -0,0 +1,17 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from books.inventory import release_expired
+from books.models import SessionCart
+
+
+class Command(BaseCommand):
+    help = 'Delete carts whose session has expired (run after clearsessions) and expired stock reservations'
+
+    def handle(self, *args, **options):
+        live_sessions = Session.objects.filter(expire_date__gt=timezone.now()).values('session_key')
+        deleted, _ = SessionCart.objects.exclude(session_key__in=live_sessions).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} stale carts'))
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock reservations'))
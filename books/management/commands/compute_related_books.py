@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books.recommendations import MAX_BASKET, compute_related_books
+
+
+class Command(BaseCommand):
+    help = 'Recompute related books from co-purchases, falling back to the same category (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=getattr(settings, 'RELATED_BOOKS_LIMIT', 8),
+                            help='Related books stored per book')
+        parser.add_argument('--min-support', type=int, default=1,
+                            help='Orders two books must share to count as bought together')
+        parser.add_argument('--max-basket', type=int, default=MAX_BASKET,
+                            help='Ignore orders with more distinct books than this')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        copurchase, category = compute_related_books(
+            options['limit'], options['min_support'], options['max_basket'],
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {copurchase} co-purchase and {category} same-category recommendations in {elapsed:.1f}s'
+        ))
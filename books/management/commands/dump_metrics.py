@@ -0,0 +1,32 @@
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Print the request metrics collected by a running server (Prometheus text format)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='http://127.0.0.1:8000/api/_metrics',
+            help='Metrics endpoint of the server to query',
+        )
+        parser.add_argument(
+            '--token',
+            default=getattr(settings, 'METRICS_TOKEN', ''),
+            help='Bearer token the endpoint accepts (default: METRICS_TOKEN)',
+        )
+
+    def handle(self, *args, **options):
+        # Metrics are aggregated in the serving process, so they have to be
+        # fetched from it rather than read from this one.
+        request = urllib.request.Request(options['url'])
+        if options['token']:
+            request.add_header('Authorization', f'Bearer {options["token"]}')
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                self.stdout.write(response.read().decode('utf-8'), ending='')
+        except OSError as exc:
+            raise CommandError(f'Could not fetch {options["url"]}: {exc}')
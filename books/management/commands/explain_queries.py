@@ -0,0 +1,147 @@
+import json
+import re
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from books.models import Book, Category, CategoryStats
+from orders.models import Order
+
+
+# Tables small enough that reading them whole is fine
+SMALL_TABLES = {Category._meta.db_table, CategoryStats._meta.db_table}
+
+
+def hot_queries(book, category):
+    """
+    ``(name, url or queryset, sorts)`` for the catalog and order pages whose
+    queries must be index-backed. ``sorts`` marks pages ranked by search
+    relevance, which can't come from an index. Sorting the groups of a
+    ``GROUP BY`` (facet values ranked by count) is always allowed.
+    """
+    first_page = Client().get(reverse('book-list'), HTTP_ACCEPT='application/json').json()
+    return [
+        ('books:home', reverse('books:home'), False),
+        ('books:book_list', reverse('books:book_list'), False),
+        ('books:book_list (category)', reverse('books:book_list') + f'?category={category.slug}', False),
+        ('books:book_detail', reverse('books:book_detail', kwargs={'slug': book.slug}), False),
+        ('books:search_books', reverse('books:search_books') + f'?q={book.title.split()[0]}', True),
+        ('book-list', reverse('book-list'), False),
+        ('book-list (next page)', first_page.get('next') or reverse('book-list'), False),
+        ('book-list (category)', reverse('book-list') + f'?category={category.slug}', False),
+        ('category-list', reverse('category-list'), False),
+        ('featured-books-api', reverse('featured-books-api'), False),
+        ('book-detail-api', reverse('book-detail-api', kwargs={'slug': book.slug}), False),
+        # orders.views.order_history (the page itself has no template yet)
+        ('orders:order_history', Order.objects.select_related('customer').order_by('-created_at')[:10], False),
+    ]
+
+
+def sqlite_problems(rows):
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        scan = re.match(r'SCAN (?:TABLE )?(\w+)(.*)', detail)
+        # Index scans and full-text (virtual table) lookups are fine
+        if scan and not re.match(r' (USING|VIRTUAL TABLE)', scan.group(2)) and scan.group(1) not in SMALL_TABLES:
+            problems.append(f'full scan of {scan.group(1)}')
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            problems.append('sort without an index')
+    return problems
+
+
+def mysql_problems(rows):
+    problems = []
+
+    def walk(node):
+        if isinstance(node, dict):
+            table = node.get('table_name')
+            if node.get('access_type') == 'ALL' and table not in SMALL_TABLES:
+                problems.append(f'full scan of {table}')
+            if node.get('using_filesort'):
+                problems.append('sort without an index')
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+
+    walk(json.loads(rows[0][0]))
+    return problems
+
+
+def postgresql_problems(rows):
+    problems = []
+    for (line,) in rows:
+        scan = re.search(r'Seq Scan on (\w+)', line)
+        if scan and scan.group(1) not in SMALL_TABLES:
+            problems.append(f'full scan of {scan.group(1)}')
+        elif re.match(r'\s*(->\s*)?Sort\b', line):
+            problems.append('sort without an index')
+    return problems
+
+
+EXPLAIN = {
+    'sqlite': ('EXPLAIN QUERY PLAN', sqlite_problems),
+    'mysql': ('EXPLAIN FORMAT=JSON', mysql_problems),
+    'postgresql': ('EXPLAIN', postgresql_problems),
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queries behind the hot catalog and order pages and flag full scans and unindexed sorts'
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(f'EXPLAIN output of {connection.vendor} is not supported')
+        prefix, find_problems = EXPLAIN[connection.vendor]
+
+        setup_test_environment()
+        book = Book.objects.available().first()
+        category = Category.objects.filter(book__is_available=True).first()
+        if book is None or category is None:
+            raise CommandError('Load some books first (manage.py load_sample_data)')
+
+        client = Client()
+        seen = set()
+        flagged = 0
+        for name, target, sorts in hot_queries(book, category):
+            # Run against a cold cache so cached lookups are explained too
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                if isinstance(target, str):
+                    client.get(target, HTTP_ACCEPT='application/json,text/html')
+                else:
+                    list(target)
+
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                    continue
+                seen.add(sql)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'{prefix} {sql}')
+                    plan = cursor.fetchall()
+                ranked = sorts or ' GROUP BY ' in sql
+                problems = [
+                    problem for problem in find_problems(plan)
+                    if not (ranked and problem == 'sort without an index')
+                ]
+                if problems:
+                    flagged += 1
+                    self.stdout.write(self.style.ERROR(f'{name:<28} {", ".join(problems)}'))
+                    self.stdout.write(f'    {sql}')
+                elif options['verbosity'] > 1:
+                    self.stdout.write(self.style.SUCCESS(f'{name:<28} ok'))
+                    self.stdout.write(f'    {sql}')
+                if options['verbosity'] > 1 or problems:
+                    for row in plan:
+                        self.stdout.write(f'      {row[-1]}')
+
+        if flagged:
+            raise CommandError(f'{flagged} of {len(seen)} hot queries are not fully index-backed')
+        self.stdout.write(self.style.SUCCESS(f'All {len(seen)} hot queries use indexes'))
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from books.export import FORMATS, export_chunks
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Write the catalog as NDJSON or CSV to a file or stdout, optionally gzipped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout); .gz implies --gzip')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Books read from the database per query')
+        parser.add_argument('--available-only', action='store_true',
+                            help='Leave out books that are not available')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        compress = options['gzip'] or bool(output and output.endswith('.gz'))
+        queryset = Book.objects.available() if options['available_only'] else Book.objects.all()
+        chunks = export_chunks(options['format'], queryset, compress, options['chunk_size'])
+
+        stream = open(output, 'wb') if output else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in chunks:
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if output:
+                stream.close()
+            else:
+                stream.flush()
+
+        if output:
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {output}'))
@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from books.cache import bump_catalog_version
+from books.importer import CatalogImporter
+from books.inverted_index import InvertedIndexSearchBackend, rebuild_index
+from books.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Import books from CSV or JSON Lines files (optionally gzipped), resumably'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='.csv, .jsonl or .ndjson files, optionally .gz')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows validated and written per transaction')
+        parser.add_argument('--image-workers', type=int, default=8,
+                            help='Threads fetching cover images')
+        parser.add_argument('--image-root',
+                            help='Directory that relative image paths are resolved against')
+        parser.add_argument('--checkpoint-dir', default=str(Path(settings.BASE_DIR) / 'var' / 'import'),
+                            help='Where progress is saved for --resume')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue an interrupted import from its checkpoint')
+        parser.add_argument('--skip-existing', action='store_true',
+                            help='Only add new books, leaving the ones already in the catalog untouched')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 0
+        total_rows = total_time = 0
+        for path in options['paths']:
+            if not Path(path).is_file():
+                raise CommandError(f'No such file: {path}')
+
+            importer = CatalogImporter(
+                chunk_size=options['chunk_size'],
+                image_workers=options['image_workers'],
+                image_root=options['image_root'],
+                checkpoint_path=Path(options['checkpoint_dir']) / f'{Path(path).name}.json',
+                log=self.stdout.write if verbose else None,
+                update_existing=not options['skip_existing'],
+            )
+            elapsed = importer.run(path, resume=options['resume'])
+            total_rows += importer.processed
+            total_time += elapsed
+            self.stdout.write(self.style.SUCCESS(
+                f'{path}: {importer.imported} books imported, {importer.skipped} existing skipped, '
+                f'{importer.invalid} invalid rows, '
+                f'{importer.images} images in {elapsed:.1f}s'
+            ))
+
+        # bulk_create skips the signals that keep these up to date
+        bump_catalog_version()
+        if isinstance(get_search_backend(), InvertedIndexSearchBackend):
+            rebuild_index()
+
+        if total_time:
+            self.stdout.write(self.style.SUCCESS(f'{total_rows / total_time:.0f} rows/sec overall'))
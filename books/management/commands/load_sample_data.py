@@ -1,11 +1,8 @@
-import os
-import django
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from books.models import Book, Category
 from django.utils.text import slugify
-from books.models import Book, Category
-import random
+from books.importer import CatalogImporter
+from books.recommendations import compute_related_books
+from books.models import Category
 
 
 class Command(BaseCommand):
@@ -19,13 +16,11 @@ class Command(BaseCommand):
             'Children', 'Young Adult', 'Poetry', 'Cooking', 'Travel'
         ]
 
-        categories = {}
         for cat_name in categories_data:
             category, created = Category.objects.get_or_create(
                 name=cat_name,
                 defaults={'slug': slugify(cat_name)}
             )
-            categories[cat_name] = category
             if created:
                 self.stdout.write(self.style.SUCCESS(f'Created category: {cat_name}'))
 
@@ -173,43 +168,22 @@ class Command(BaseCommand):
             }
         ]
 
-        # Create books with images
-        created_count = 0
-        for i, book_data in enumerate(books_data):
-            category = categories.get(book_data['category'])
-            if category:
-                # Download book cover image
-                image_url = f"https://picsum.photos/seed/book-{i+1}/300/400"
-                image_filename = f"book_{i+1}.jpg"
-                image_path = os.path.join(settings.MEDIA_ROOT, 'book_covers', image_filename)
-                
-                # Create directory if it doesn't exist
-                os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                
-                # Download image
-                try:
-                    import urllib.request
-                    urllib.request.urlretrieve(image_url, image_path)
-                    image_relative_path = f'book_covers/{image_filename}'
-                except:
-                    image_relative_path = None
-                
-                book, created = Book.objects.get_or_create(
-                    title=book_data['title'],
-                    defaults={
-                        'slug': slugify(book_data['title']),
-                        'author': book_data['author'],
-                        'description': book_data['description'],
-                        'price': book_data['price'],
-                        'category': category,
-                        'is_available': True,
-                        'image': image_relative_path
-                    }
-                )
-                if created:
-                    created_count += 1
-                    self.stdout.write(self.style.SUCCESS(f'Created book: {book.title} with image'))
+        # Covers are downloaded in parallel by the catalog importer. Books
+        # already in the catalog are left alone, so running this again
+        # doesn't reset their stock, price or availability.
+        rows = [
+            {**book_data, 'image': f'https://picsum.photos/seed/book-{i+1}/300/400'}
+            for i, book_data in enumerate(books_data)
+        ]
+        importer = CatalogImporter(log=self.stdout.write, update_existing=False)
+        importer.import_rows(rows)
+        # Same-category suggestions until there are orders; this also
+        # invalidates the catalog cache
+        compute_related_books()
 
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully loaded {created_count} sample books')
+            self.style.SUCCESS(
+                f'Successfully loaded {importer.imported} sample books '
+                f'({importer.skipped} were already in the catalog)'
+            )
         )
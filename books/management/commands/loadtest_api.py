@@ -0,0 +1,124 @@
+import http.client
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from books.models import Book
+
+
+def catalog_paths():
+    """The read-only catalog endpoints of ``books.async_api``, for a book in the local database"""
+    book = Book.objects.available().order_by('-created_at', 'id').first()
+    if book is None:
+        raise CommandError('Load some books first (manage.py load_sample_data), or pass --path')
+    word = book.title.split()[0]
+    return [
+        reverse('featured-books-api'),
+        reverse('book-detail-api', kwargs={'slug': book.slug}),
+        reverse('category-list'),
+        reverse('search-books-api') + f'?q={word}',
+    ]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the catalog API of running servers with concurrent keep-alive clients, '
+        'e.g. a WSGI deployment against an ASGI one with CATALOG_ASYNC_API (same database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', metavar='[NAME=]URL',
+                            help='Servers to compare, e.g. wsgi=http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help='Simultaneous clients per server')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds to run against each server')
+        parser.add_argument('--warmup', type=float, default=1.0,
+                            help='Seconds of untimed requests before measuring')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request (repeatable); default: the read-only catalog endpoints')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, _, url = target.rpartition('=')
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise CommandError(f'Not an http(s) URL: {url}')
+            targets.append((name or parts.netloc, parts))
+        paths = options['paths'] or catalog_paths()
+
+        self.stdout.write(
+            f'{len(paths)} paths, {options["concurrency"]} clients, {options["duration"]:g}s per server'
+        )
+        self.stdout.write(
+            f'{"server":<24} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+        )
+        baseline = None
+        for name, parts in targets:
+            if options['warmup'] > 0:
+                self.run(parts, paths, options['concurrency'], options['warmup'])
+            latencies, errors, elapsed = self.run(parts, paths, options['concurrency'], options['duration'])
+            throughput = len(latencies) / elapsed
+            latencies.sort()
+            line = (
+                f'{name:<24} {len(latencies):>9} {errors:>7} {throughput:>9.1f} '
+                f'{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} '
+                f'{percentile(latencies, 0.99) * 1000:>8.1f}'
+            )
+            if baseline is None:
+                baseline = throughput
+            elif baseline:
+                line += f'  {throughput / baseline:.2f}x'
+            self.stdout.write(line)
+
+    def run(self, parts, paths, concurrency, duration):
+        """Request ``paths`` round-robin from ``concurrency`` threads for ``duration`` seconds"""
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        prefix = parts.path.rstrip('/')
+        lock = threading.Lock()
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        def client(offset):
+            nonlocal errors
+            timings = []
+            failed = 0
+            connection = connection_class(parts.hostname, parts.port, timeout=30)
+            index = offset
+            while time.perf_counter() < deadline:
+                path = prefix + paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers={'Accept': 'application/json'})
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    continue
+                if response.status == 200:
+                    timings.append(time.perf_counter() - start)
+                else:
+                    failed += 1
+            connection.close()
+            with lock:
+                latencies.extend(timings)
+                errors += failed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(client, range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from books.search import backend_for_vendor
+    backend_for_vendor(schema_editor.connection.vendor).install(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from books.search import backend_for_vendor
+    backend_for_vendor(schema_editor.connection.vendor).uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0002_contactmessage"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
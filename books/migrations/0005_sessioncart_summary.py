@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def fill_cart_summaries(apps, schema_editor):
+    SessionCart = apps.get_model("books", "SessionCart")
+    for cart in SessionCart.objects.iterator():
+        cart.item_count = sum(int(item["quantity"]) for item in cart.items.values())
+        cart.total = sum(
+            (Decimal(item["price"]) * int(item["quantity"]) for item in cart.items.values()),
+            Decimal("0.00"),
+        )
+        cart.save(update_fields=["item_count", "total"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0004_sessioncart"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sessioncart",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="sessioncart",
+            name="total",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_cart_summaries, migrations.RunPython.noop),
+    ]
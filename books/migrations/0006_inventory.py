@@ -0,0 +1,66 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def drop_sqlite_search_index(apps, schema_editor):
+    # SQLite adds the column by rebuilding books_book, which drops the
+    # triggers keeping the FTS5 index in sync; reinstall it around that.
+    if schema_editor.connection.vendor == "sqlite":
+        from books.search import SQLiteFTS5SearchBackend
+        SQLiteFTS5SearchBackend().uninstall(schema_editor)
+
+
+def install_sqlite_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        from books.search import SQLiteFTS5SearchBackend
+        SQLiteFTS5SearchBackend().install(schema_editor)
+
+
+def mark_sold_books_out_of_stock(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Book.objects.filter(is_available=False).update(stock=0)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0005_sessioncart_summary"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_search_index, install_sqlite_search_index),
+        migrations.AddField(
+            model_name="book",
+            name="stock",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(install_sqlite_search_index, drop_sqlite_search_index),
+        migrations.RunPython(mark_sold_books_out_of_stock, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("session_key", models.CharField(db_index=True, max_length=40)),
+                ("quantity", models.PositiveIntegerField()),
+                ("expires_at", models.DateTimeField(db_index=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservations",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("book", "session_key")},
+            },
+        ),
+    ]
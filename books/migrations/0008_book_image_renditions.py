@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def drop_sqlite_search_index(apps, schema_editor):
+    # Adding the column rebuilds books_book on SQLite (see 0006_inventory)
+    if schema_editor.connection.vendor == "sqlite":
+        from books.search import SQLiteFTS5SearchBackend
+        SQLiteFTS5SearchBackend().uninstall(schema_editor)
+
+
+def install_sqlite_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        from books.search import SQLiteFTS5SearchBackend
+        SQLiteFTS5SearchBackend().install(schema_editor)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0007_category_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_search_index, install_sqlite_search_index),
+        migrations.AddField(
+            model_name="book",
+            name="image_renditions",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(install_sqlite_search_index, drop_sqlite_search_index),
+    ]
@@ -0,0 +1,81 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+
+def compute_stats(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Category = apps.get_model("books", "Category")
+    CategoryStats = apps.get_model("books", "CategoryStats")
+    available = Q(book__is_available=True)
+    rows = Category.objects.order_by().values("id").annotate(
+        book_count=Count("book", filter=available),
+        min_price=Min("book__price", filter=available),
+        max_price=Max("book__price", filter=available),
+    )
+    CategoryStats.objects.bulk_create([
+        CategoryStats(
+            category_id=row["id"],
+            book_count=row["book_count"],
+            min_price=row["min_price"],
+            max_price=row["max_price"],
+            newest_book=Book.objects.filter(category_id=row["id"], is_available=True)
+            .order_by("-created_at", "-id")
+            .first(),
+            updated_at=timezone.now(),
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("books", "0009_relatedbook"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategoryStats",
+            fields=[
+                (
+                    "category",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="books.category",
+                    ),
+                ),
+                ("book_count", models.PositiveIntegerField(default=0)),
+                (
+                    "min_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "max_price",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "newest_book",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Category stats",
+            },
+        ),
+        migrations.RunPython(compute_stats, migrations.RunPython.noop),
+    ]
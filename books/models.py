@@ -1,12 +1,23 @@
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.lookups import Exact
 from django.urls import reverse
 from django.utils.text import slugify
 
 
+class CategoryQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Join in the denormalized ``stats`` row (see books.stats)"""
+        return self.select_related('stats__newest_book')
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = CategoryQuerySet.as_manager()
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -21,6 +32,24 @@ class Category(models.Model):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    def available(self):
+        # ``is_available = true`` rather than the bare column Django emits
+        # for ``is_available=True`` on SQLite, which can't use an index
+        return self.filter(Exact(F('is_available'), Value(True)))
+    
+    def with_category(self):
+        return self.select_related('category')
+    
+    def for_listing(self):
+        """Available books with their category joined in, for list pages and APIs"""
+        return self.available().with_category()
+
+
+class BookManager(models.Manager.from_queryset(BookQuerySet)):
+    pass
+
+
 class Book(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
@@ -28,18 +57,63 @@ class Book(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='books/', blank=True, null=True)
+    # Resized copies of ``image``, see books.images
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    stock = models.PositiveIntegerField(default=1)
     is_available = models.BooleanField(default=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BookManager()
+    
     class Meta:
         ordering = ['-created_at']
+        # One per hot catalog query; `manage.py explain_queries` checks them
+        indexes = [
+            # Listings and keyset pages: available books, newest first
+            models.Index(fields=['is_available', '-created_at', 'id'], name='book_available_newest'),
+            # The same within a category
+            models.Index(fields=['category', 'is_available', '-created_at', 'id'], name='book_category_newest'),
+            # Featured books (most expensive first)
+            models.Index(fields=['is_available', '-price'], name='book_available_price'),
+            # Last-Modified of the catalog (books.cache validators)
+            models.Index(fields=['is_available', 'updated_at'], name='book_available_updated'),
+            # Matching imported rows to existing books (books.importer)
+            models.Index(fields=['title', 'author'], name='book_title_author'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        # Lets books.signals refresh the stats of a category a book leaves
+        book._loaded_category_id = book.__dict__.get('category_id')
+        # Lets save() tell a restock of a sold-out book from a hidden one
+        book._loaded_stock = book.__dict__.get('stock')
+        book._loaded_available = book.__dict__.get('is_available')
+        return book
     
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        # Availability follows the stock: selling out hides a book and
+        # restocking a sold-out one shows it again. Books hidden by hand
+        # while in stock stay hidden.
+        was_available = self.is_available
+        if self.stock == 0:
+            self.is_available = False
+        elif (
+            getattr(self, '_loaded_stock', None) == 0
+            and self._loaded_available is False
+            and not self.is_available
+        ):
+            self.is_available = True
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.is_available != was_available:
+            kwargs['update_fields'] = {*update_fields, 'is_available'}
         super().save(*args, **kwargs)
+        self._loaded_stock = self.stock
+        self._loaded_available = self.is_available
     
     def get_absolute_url(self):
         return reverse('book_detail', kwargs={'slug': self.slug})
@@ -48,6 +122,25 @@ class Book(models.Model):
         return f"{self.title} by {self.author}"
 
 
+class CategoryStats(models.Model):
+    """
+    Figures about a category's available books, kept up to date by
+    books.stats so listings don't aggregate over the books table
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    book_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    newest_book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = "Category stats"
+    
+    def __str__(self):
+        return f"{self.category_id}: {self.book_count} books"
+
+
 class ContactMessage(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -64,3 +157,54 @@ class ContactMessage(models.Model):
     
     def get_absolute_url(self):
         return reverse('books:contact_page')
+
+
+class StockReservation(models.Model):
+    """Copies of a book held in a shopper's cart until ``expires_at``"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
+    session_key = models.CharField(max_length=40, db_index=True)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = [('book', 'session_key')]
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.book_id} for {self.session_key}"
+
+
+class SessionCart(models.Model):
+    """Shopping cart contents for a session (see books.cart.Cart)"""
+    session_key = models.CharField(max_length=40, unique=True)
+    items = models.JSONField(default=dict)
+    item_count = models.PositiveIntegerField(default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Cart {self.session_key}"
+
+
+class RelatedBook(models.Model):
+    """
+    Precomputed "related books" for a book's page, best first (see
+    books.recommendations)
+    """
+    SOURCE_CHOICES = [
+        ('copurchase', 'Bought together'),
+        ('category', 'Same category'),
+    ]
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommended_with')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField(default=0)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    
+    class Meta:
+        ordering = ['book', 'rank']
+        # Also the index a book page's lookup uses
+        unique_together = [('book', 'rank')]
+    
+    def __str__(self):
+        return f"{self.related_id} for {self.book_id} (#{self.rank})"
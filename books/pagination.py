@@ -0,0 +1,267 @@
+"""
+Keyset (cursor) pagination for catalog listings.
+
+Pages are addressed by the sort key of the last row seen rather than an
+OFFSET, so fetching page 1,000 costs the same as fetching page 1. The
+default ordering is ``(-created_at, id)``; querysets that carry their own
+ordering (e.g. search results ordered by relevance) are paginated on that
+ordering, with ``id`` appended as a tie-breaker.
+"""
+import base64
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+DEFAULT_ORDERING = ('-created_at', 'id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _count_key(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(f'{sql}|{params!r}'.encode('utf-8')).hexdigest()
+    return f'catalog:count:{digest}'
+
+
+def cached_count(queryset):
+    """
+    Return ``queryset.count()``, cached per filter so listing pages don't
+    recount the same result set on every request.
+    """
+    if queryset.query.is_empty():
+        return 0
+    key = _count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'CATALOG_COUNT_CACHE_TIMEOUT', 60))
+    return count
+
+
+async def acached_count(queryset):
+    """Async version of ``cached_count``"""
+    if queryset.query.is_empty():
+        return 0
+    key = _count_key(queryset)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, getattr(settings, 'CATALOG_COUNT_CACHE_TIMEOUT', 60))
+    return count
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return payload['v'], bool(payload['r'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` on its ordering using opaque cursors"""
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = self.get_ordering(queryset)
+
+    @staticmethod
+    def get_ordering(queryset):
+        ordering = [str(field) for field in queryset.query.order_by] or list(DEFAULT_ORDERING)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('id')
+        return ordering
+
+    def _field_value(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def _row_values(self, obj):
+        # Rows may be model instances or dicts from a .values() queryset
+        if isinstance(obj, dict):
+            return [obj[field.lstrip('-')] for field in self.ordering]
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def _seek(self, values, reverse):
+        """Build the ``WHERE`` clause selecting rows after ``values``"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            value = self._field_value(name, value)
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _page_queryset(self, cursor):
+        """``(queryset, reverse)`` fetching the page at ``cursor`` plus one row"""
+        reverse = False
+        queryset = self.queryset
+        ordering = self.ordering
+
+        if cursor:
+            values, reverse = decode_cursor(cursor)
+            if len(values) != len(ordering):
+                raise InvalidCursor('Invalid cursor')
+            queryset = queryset.filter(self._seek(values, reverse))
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+        return queryset.order_by(*ordering)[:self.per_page + 1], reverse
+
+    def page(self, cursor=None):
+        queryset, reverse = self._page_queryset(cursor)
+        return self._make_page(list(queryset), cursor, reverse)
+
+    async def apage(self, cursor=None):
+        """Async version of ``page``"""
+        queryset, reverse = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset], cursor, reverse)
+
+    def _make_page(self, rows, cursor, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self._row_values(rows[-1]))
+            if cursor and (has_more or not reverse):
+                previous_cursor = encode_cursor(self._row_values(rows[0]), reverse=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate_catalog(request, queryset, per_page=None):
+    """
+    Paginate ``queryset`` for an HTML view. Returns ``(page, context)`` where
+    ``context`` holds the cached total and the next/previous page URLs.
+    """
+    per_page = per_page or getattr(settings, 'CATALOG_PAGE_SIZE', 24)
+    paginator = KeysetPaginator(queryset, per_page)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = paginator.page()
+
+    params = request.GET.copy()
+    params.pop('cursor', None)
+
+    def page_url(cursor):
+        if cursor is None:
+            return None
+        return '?' + urlencode({**params.dict(), 'cursor': cursor})
+
+    context = {
+        'page': page,
+        'total_count': cached_count(queryset),
+        'next_page_url': page_url(page.next_cursor),
+        'previous_page_url': page_url(page.previous_cursor),
+    }
+    return page, context
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination class backed by ``KeysetPaginator``"""
+    page_size = api_settings.PAGE_SIZE or 20
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Sliced querysets (e.g. "featured" top-N lists) are returned whole
+        if queryset.query.is_sliced:
+            return None
+
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.page_size)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        self.count = cached_count(queryset)
+        return list(self.page)
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        Async version of ``paginate_queryset`` for plain Django async views
+        (see ``books.async_api``); raises ``InvalidCursor`` for bad cursors.
+        """
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.page_size)
+        self.page = await paginator.apage(request.GET.get(self.cursor_query_param))
+        self.count = await acached_count(queryset)
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'count': self.count,
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
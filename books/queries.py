@@ -0,0 +1,34 @@
+"""
+Query builders shared by the catalog pages (``books.views``) and the sync
+and async APIs (``books.api``, ``books.async_api``), so each listing is
+built, indexed and tuned in one place.
+"""
+from .facets import filter_books
+from .models import Book
+from .search import search_books
+
+
+FEATURED_COUNT = 8
+
+
+def catalog_books(category=None, query=None, facets=None):
+    """
+    Available books with their category, narrowed to a category slug, to
+    the ``facets`` selected (see ``books.facets``) and to the books
+    matching a search ``query`` (ordered by relevance).
+    """
+    books = Book.objects.for_listing()
+    if category:
+        books = books.filter(category__slug=category)
+    if facets:
+        books = filter_books(books, facets)
+    if query:
+        books = search_books(books, query)
+    return books
+
+
+def featured_books(books=None):
+    """The books featured by the API: the most expensive of ``books`` (default all available ones)"""
+    if books is None:
+        books = Book.objects.for_listing()
+    return books.order_by('-price')[:FEATURED_COUNT]
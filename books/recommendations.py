@@ -0,0 +1,124 @@
+"""
+Related-book recommendations.
+
+``compute_related_books`` derives each book's related books from order
+history. Two books are related when they are bought together, scored by
+the cosine similarity of the sets of orders containing them::
+
+    score(a, b) = orders with both / sqrt(orders with a * orders with b)
+
+Co-purchase counts are built in NumPy from a sparse list of the pairs that
+actually occur in some order, never an n x n matrix, so memory grows with
+the number of distinct pairs rather than with the catalog size squared.
+Books with fewer than ``limit`` co-purchase neighbours are topped up with
+the best-selling (then newest) books of their category.
+
+The result replaces the ``RelatedBook`` table, which the book page reads
+with one indexed lookup (see ``books.cache.get_book_detail``). Run
+``manage.py compute_related_books`` periodically, e.g. nightly from cron.
+"""
+import numpy as np
+from django.db import transaction
+
+from orders.models import OrderItem
+from .cache import bump_catalog_version
+from .models import Book, RelatedBook
+
+
+# Orders with more distinct books than this are left out of the pair
+# counts: they add size**2 pairs and say little about what goes together.
+MAX_BASKET = 50
+
+
+def co_purchase_neighbours(order_ids, book_ids, limit, min_support=1, max_basket=MAX_BASKET):
+    """
+    Top ``limit`` co-purchased books for every book in the parallel
+    ``order_ids``/``book_ids`` arrays. Returns ``(book, related, score)``
+    arrays sorted by book and then by descending score, and a ``{book:
+    number of orders containing it}`` dict.
+    """
+    pairs = np.unique(np.column_stack([order_ids, book_ids]).astype(np.int64), axis=0)
+    orders = pairs[:, 0]
+    books, book_index = np.unique(pairs[:, 1], return_inverse=True)
+    popularity = np.bincount(book_index, minlength=len(books))
+
+    # ``pairs`` is sorted by order, so each order is a contiguous run.
+    # Pair every item of a run with every other item of the same run.
+    starts = np.flatnonzero(np.diff(orders, prepend=-1))
+    sizes = np.diff(np.r_[starts, len(orders)])
+    item_size = np.repeat(sizes, sizes)
+    item_start = np.repeat(starts, sizes)
+    items = np.flatnonzero((item_size >= 2) & (item_size <= max_basket))
+    size, start = item_size[items], item_start[items]
+
+    left = np.repeat(items, size)
+    offset = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+    right = np.repeat(start, size) + offset
+    distinct = left != right
+    a, b = book_index[left[distinct]], book_index[right[distinct]]
+
+    # Sparse co-occurrence counts, one entry per (a, b) bought together
+    codes, counts = np.unique(a * len(books) + b, return_counts=True)
+    a, b = codes // len(books), codes % len(books)
+    supported = counts >= min_support
+    a, b, counts = a[supported], b[supported], counts[supported]
+    scores = counts / np.sqrt(popularity[a] * popularity[b])
+
+    # Best first within each book; ties go to the pair bought more often
+    order = np.lexsort((b, -counts, -scores, a))
+    a, b, scores = a[order], b[order], scores[order]
+    group_start = np.flatnonzero(np.diff(a, prepend=-1))
+    group_size = np.diff(np.r_[group_start, len(a)])
+    rank = np.arange(len(a)) - np.repeat(group_start, group_size)
+    top = rank < limit
+
+    return books[a[top]], books[b[top]], scores[top], dict(zip(books.tolist(), popularity.tolist()))
+
+
+def compute_related_books(limit=8, min_support=1, max_basket=MAX_BASKET):
+    """
+    Rebuild the ``RelatedBook`` table with up to ``limit`` related books
+    per available book. Returns ``(co-purchase entries, category entries)``.
+    """
+    rows = np.array(
+        list(OrderItem.objects.exclude(order__status='cancelled').values_list('order_id', 'book_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    neighbours = {}
+    popularity = {}
+    if len(rows):
+        book, related, scores, popularity = co_purchase_neighbours(
+            rows[:, 0], rows[:, 1], limit, min_support, max_basket,
+        )
+        for book_id, related_id, score in zip(book.tolist(), related.tolist(), scores.tolist()):
+            neighbours.setdefault(book_id, []).append((related_id, score))
+
+    available = list(Book.objects.available().values_list('id', 'category_id', 'created_at'))
+    by_category = {}
+    for book_id, category_id, _ in sorted(
+        available, key=lambda b: (popularity.get(b[0], 0), b[2]), reverse=True,
+    ):
+        by_category.setdefault(category_id, []).append(book_id)
+
+    entries = []
+    copurchase = 0
+    for book_id, category_id, _ in available:
+        chosen = neighbours.get(book_id, [])
+        copurchase += len(chosen)
+        entries += [
+            RelatedBook(book_id=book_id, related_id=related_id, rank=rank, score=score, source='copurchase')
+            for rank, (related_id, score) in enumerate(chosen)
+        ]
+        if len(chosen) < limit:
+            seen = {book_id, *(related_id for related_id, _ in chosen)}
+            fallback = [other for other in by_category[category_id][:limit + len(seen)] if other not in seen]
+            entries += [
+                RelatedBook(book_id=book_id, related_id=related_id, rank=rank, source='category')
+                for rank, related_id in enumerate(fallback[:limit - len(chosen)], start=len(chosen))
+            ]
+
+    with transaction.atomic():
+        RelatedBook.objects.all().delete()
+        RelatedBook.objects.bulk_create(entries, batch_size=1000)
+    bump_catalog_version()
+    return copurchase, len(entries) - copurchase
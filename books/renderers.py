@@ -0,0 +1,30 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+
+_encoder = json.JSONEncoder(
+    ensure_ascii=False, allow_nan=False, separators=(',', ':'), check_circular=False,
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes plain data (str/int/float/bool/None, lists
+    and dicts, as produced by ``books.fast_serializers``) with a shared
+    C-accelerated encoder, skipping DRF's per-call encoder setup and
+    ``default`` hook. Output is identical to ``JSONRenderer``; anything else
+    (indented output, Decimals, dates) falls back to it.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = _encoder.encode(data)
+        except (TypeError, ValueError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for embedding in <script> tags
+        return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
@@ -0,0 +1,222 @@
+"""
+Full-text search backends for the book catalog.
+
+Every catalog view that searches books goes through ``get_search_backend()``
+instead of OR-ing ``icontains`` lookups together, so the database can answer
+the query from its full-text index and rank the matches by relevance.
+
+The backend is picked from ``settings.BOOK_SEARCH_BACKEND`` (a dotted path)
+or, when that is unset, from the vendor of the default database connection.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Book
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SEARCH_FIELDS = ('title', 'author', 'description')
+
+
+def tokenize(query):
+    """Split a raw search string into lowercase word tokens"""
+    return [token.lower() for token in TOKEN_RE.findall(query or '')]
+
+
+class BookSearchBackend:
+    """
+    Base class for catalog search backends.
+
+    ``search()`` narrows a ``Book`` queryset to the rows matching ``query``,
+    annotates each row with a ``relevance`` score and orders by it.
+    """
+    def search(self, queryset, query):
+        raise NotImplementedError('Search backends must implement search()')
+
+    def rebuild(self):
+        """Rebuild the underlying index from the ``Book`` table"""
+
+    def install(self, schema_editor):
+        """Create the index structures (called from migrations)"""
+
+    def uninstall(self, schema_editor):
+        """Drop the index structures (called from migrations)"""
+
+    def order_by_relevance(self, queryset):
+        return queryset.order_by('-relevance', '-created_at', 'id')
+
+
+class IContainsSearchBackend(BookSearchBackend):
+    """Unindexed fallback for databases without full-text support"""
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(title__icontains=token) |
+                Q(author__icontains=token) |
+                Q(description__icontains=token)
+            )
+        queryset = queryset.annotate(relevance=Value(0.0, output_field=FloatField()))
+        return self.order_by_relevance(queryset)
+
+
+class MySQLFullTextSearchBackend(BookSearchBackend):
+    """MySQL ``FULLTEXT`` index queried with ``MATCH ... AGAINST``"""
+    index_name = 'books_book_fulltext'
+
+    # InnoDB's defaults (innodb_ft_min_token_size and its built-in stopword
+    # list): these words are never indexed, so requiring them can't match
+    min_token_size = 3
+    stopwords = frozenset((
+        'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how',
+        'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what',
+        'when', 'where', 'who', 'will', 'with', 'und', 'www',
+    ))
+
+    def _match_sql(self):
+        columns = ', '.join(connection.ops.quote_name(f) for f in SEARCH_FIELDS)
+        return f'MATCH({columns}) AGAINST (%s IN BOOLEAN MODE)'
+
+    def search(self, queryset, query):
+        tokens = [
+            token for token in tokenize(query)
+            if len(token) >= self.min_token_size and token not in self.stopwords
+        ]
+        if not tokens:
+            return queryset.none()
+
+        # Every indexed token is required and prefix-matched, so partially
+        # typed words still hit the index.
+        boolean_query = ' '.join(f'+{token}*' for token in tokens)
+        queryset = queryset.annotate(
+            relevance=RawSQL(self._match_sql(), [boolean_query], output_field=FloatField())
+        ).filter(relevance__gt=0)
+        return self.order_by_relevance(queryset)
+
+    def install(self, schema_editor):
+        quote = schema_editor.quote_name
+        columns = ', '.join(quote(f) for f in SEARCH_FIELDS)
+        schema_editor.execute(
+            f'CREATE FULLTEXT INDEX {quote(self.index_name)} '
+            f'ON {quote(Book._meta.db_table)} ({columns})'
+        )
+
+    def uninstall(self, schema_editor):
+        quote = schema_editor.quote_name
+        schema_editor.execute(
+            f'DROP INDEX {quote(self.index_name)} ON {quote(Book._meta.db_table)}'
+        )
+
+    def rebuild(self):
+        with connection.schema_editor() as schema_editor:
+            self.uninstall(schema_editor)
+            self.install(schema_editor)
+
+
+class SQLiteFTS5SearchBackend(BookSearchBackend):
+    """SQLite FTS5 external-content table kept in sync by triggers"""
+    table_name = 'books_book_fts'
+
+    def _match_query(self, tokens):
+        return ' '.join(f'"{token}"*' for token in tokens)
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        match = self._match_query(tokens)
+        fts = self.table_name
+        book_table = Book._meta.db_table
+        # Joined so MATCH runs once and bm25() comes from the same row (a
+        # correlated subquery re-ran it for every book). The unary ``+``
+        # stops SQLite from driving the join from books_book and probing
+        # the full-text index by rowid, which re-runs MATCH per book too.
+        queryset = queryset.extra(
+            tables=[fts],
+            where=[f'{fts} MATCH %s', f'+{fts}.rowid = "{book_table}"."id"'],
+            params=[match],
+        ).annotate(
+            # bm25() is lower for better matches, so flip the sign to keep
+            # "higher relevance first" consistent across backends.
+            relevance=RawSQL(f'-bm25({fts})', [], output_field=FloatField()),
+        )
+        return self.order_by_relevance(queryset)
+
+    def install(self, schema_editor):
+        fts = self.table_name
+        book_table = Book._meta.db_table
+        columns = ', '.join(SEARCH_FIELDS)
+        new_values = ', '.join(f'new.{f}' for f in SEARCH_FIELDS)
+        old_values = ', '.join(f'old.{f}' for f in SEARCH_FIELDS)
+
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5("
+            f"{columns}, content='{book_table}', content_rowid='id', "
+            f"tokenize='unicode61')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {book_table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {book_table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {book_table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        )
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def uninstall(self, schema_editor):
+        fts = self.table_name
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table_name}({self.table_name}) VALUES ('rebuild')")
+
+
+VENDOR_BACKENDS = {
+    'mysql': MySQLFullTextSearchBackend,
+    'sqlite': SQLiteFTS5SearchBackend,
+}
+
+
+def backend_for_vendor(vendor):
+    return VENDOR_BACKENDS.get(vendor, IContainsSearchBackend)()
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Return the configured search backend instance"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'BOOK_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        else:
+            _backend = backend_for_vendor(connection.vendor)
+    return _backend
+
+
+def search_books(queryset, query):
+    """Shortcut for ``get_search_backend().search(queryset, query)``"""
+    return get_search_backend().search(queryset, query)
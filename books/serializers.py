@@ -1,31 +1,74 @@
 from rest_framework import serializers
+from .images import srcsets
 from .models import Book, Category
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Category
-        fields = ['id', 'name', 'slug']
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """``{'webp': srcset, 'jpeg': srcset}`` for a book's cover renditions, or ``None``"""
+    
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+    
+    def to_representation(self, book):
+        url = book.image.storage.url
+        request = self.context.get('request')
+        if request is not None:
+            url = lambda name: request.build_absolute_uri(book.image.storage.url(name))
+        return srcsets(book.image.name, book.image_renditions, url)
 
 
 class BookSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    price_display = serializers.SerializerMethodField()
+    image_srcset = ImageSrcsetField()
     
     class Meta:
         model = Book
-        fields = [
-            'id', 'title', 'slug', 'author', 'description', 
-            'price', 'image', 'is_available', 'category', 
-            'created_at', 'updated_at'
-        ]
+        fields = ['id', 'title', 'slug', 'author', 'description', 'price', 'price_display', 
+                  'image', 'image_srcset', 'is_available', 'category', 'category_name', 'created_at']
+    
+    def get_price_display(self, obj):
+        return f"₹{obj.price:.2f}"
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    # Denormalized figures, see books.stats
+    book_count = serializers.IntegerField(source='stats.book_count', read_only=True)
+    min_price = serializers.DecimalField(source='stats.min_price', max_digits=10, decimal_places=2, read_only=True)
+    max_price = serializers.DecimalField(source='stats.max_price', max_digits=10, decimal_places=2, read_only=True)
+    newest_book = serializers.SlugField(source='stats.newest_book.slug', read_only=True, default=None)
+    
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'slug', 'book_count', 'min_price', 'max_price', 'newest_book', 'created_at']
 
 
 class BookListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
+    image_srcset = ImageSrcsetField()
     
     class Meta:
         model = Book
         fields = [
             'id', 'title', 'slug', 'author', 'price', 
-            'image', 'category_name', 'created_at'
+            'image', 'image_srcset', 'category_name', 'created_at'
         ]
+
+
+class CartItemSerializer(serializers.Serializer):
+    book_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+    title = serializers.CharField(read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+
+class CartSerializer(serializers.Serializer):
+    items = CartItemSerializer(many=True)
+    total_items = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_price_display = serializers.SerializerMethodField()
+    
+    def get_total_price_display(self, obj):
+        return f"₹{obj['total_price']:.2f}"
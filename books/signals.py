@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from taskqueue.models import Task
+from taskqueue.queue import enqueue
+from .cache import bump_catalog_version
+from .images import is_current
+from .inverted_index import FIELD_WEIGHTS, InvertedIndexSearchBackend, get_loaded_index
+from .models import Book, Category
+from .search import get_search_backend
+from .stats import refresh_category_stats
+from .tasks import generate_book_renditions, save_search_index
+
+
+def queue_search_index_save():
+    """Rewrite the index file shortly, once for a burst of changes"""
+    pending = Task.objects.filter(name=save_search_index.task_name, status='queued')
+    if not pending.exists():
+        enqueue(save_search_index, delay=getattr(settings, 'BOOK_SEARCH_INDEX_SAVE_DELAY', 10))
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Keep the in-memory search index in step with saves"""
+    if raw or not isinstance(get_search_backend(), InvertedIndexSearchBackend):
+        return
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return
+    index = get_loaded_index()
+    if index is not None:
+        index.add(instance)
+    queue_search_index_save()
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    """Drop deleted books from the in-memory search index"""
+    if not isinstance(get_search_backend(), InvertedIndexSearchBackend):
+        return
+    index = get_loaded_index()
+    if index is not None:
+        index.remove(instance.id)
+    queue_search_index_save()
+
+
+@receiver(post_save, sender=Book)
+def queue_cover_renditions(sender, instance, raw=False, **kwargs):
+    """Resize a new or changed cover in the background"""
+    name = instance.image.name or ''
+    if raw or is_current(name, instance.image_renditions):
+        return
+    if name or instance.image_renditions:
+        enqueue(generate_book_renditions, book_id=instance.id)
+
+
+@receiver([post_save, post_delete], sender=Book)
+def update_category_stats(sender, instance, raw=False, **kwargs):
+    """Refresh the stats of the category a book is in, and of one it left"""
+    if raw:
+        return
+    category_ids = {instance.category_id, getattr(instance, '_loaded_category_id', None)} - {None}
+    if category_ids:
+        refresh_category_stats(category_ids)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        refresh_category_stats([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Drop cached catalog querysets and fragments after any change"""
+    bump_catalog_version()
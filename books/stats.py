@@ -0,0 +1,59 @@
+"""
+Denormalized per-category statistics.
+
+``CategoryStats`` holds each category's number of available books, price
+range and newest book, so category listings (the API and the home page
+grid) read one row per category instead of aggregating over the books
+table on every request.
+
+The rows of the affected categories are refreshed whenever a book is saved
+or deleted (see ``books.signals``) and after bulk changes that bypass
+signals: catalog imports and books selling out. ``check_category_stats``
+compares every row with a fresh aggregate and repairs any drift; run it
+periodically as a safety net.
+"""
+from django.db import connection
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Book, Category, CategoryStats
+
+
+FIELDS = ['book_count', 'min_price', 'max_price', 'newest_book_id']
+
+
+def compute_category_stats(category_ids=None):
+    """Fresh ``{category_id: {field: value}}`` for ``category_ids`` (default all), in one query"""
+    available = Q(book__is_available=True)
+    newest = Book.objects.available().filter(category=OuterRef('pk')).order_by('-created_at', '-id')
+    categories = Category.objects.order_by()
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+    rows = categories.values('id').annotate(
+        book_count=Count('book', filter=available),
+        min_price=Min('book__price', filter=available),
+        max_price=Max('book__price', filter=available),
+        newest_book_id=Subquery(newest.values('id')[:1]),
+    )
+    return {row.pop('id'): row for row in rows}
+
+
+def save_category_stats(stats):
+    """Upsert ``CategoryStats`` rows from ``compute_category_stats`` output"""
+    if not stats:
+        return
+    now = timezone.now()
+    rows = [
+        CategoryStats(category_id=category_id, updated_at=now, **values)
+        for category_id, values in stats.items()
+    ]
+    options = {'update_conflicts': True, 'update_fields': [*FIELDS, 'updated_at']}
+    # MySQL's ON DUPLICATE KEY UPDATE doesn't take a conflict target
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['category']
+    CategoryStats.objects.bulk_create(rows, **options)
+
+
+def refresh_category_stats(category_ids=None):
+    """Recompute and store the stats of ``category_ids`` (default all)"""
+    save_category_stats(compute_category_stats(category_ids))
@@ -0,0 +1,55 @@
+"""
+Background tasks for the books app, run by the task queue workers.
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from taskqueue.queue import task
+from .cache import bump_catalog_version
+from .images import delete_renditions, generate_renditions, is_current
+from .inverted_index import save_index
+from .models import Book
+
+
+@task
+def notify_contact_messages(messages):
+    """Email staff a digest of newly received contact messages"""
+    recipients = settings.CONTACT_NOTIFY_EMAILS or [email for _, email in settings.ADMINS]
+    if not recipients:
+        return
+    subject = messages[0]['subject'] if len(messages) == 1 else f'{len(messages)} new contact messages'
+    send_mail(
+        subject=f'[Contact] {subject}',
+        message=render_to_string('books/email/contact_notification.txt', {'messages': messages}),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=recipients,
+    )
+
+
+@task
+def generate_book_renditions(book_id):
+    """Resize a book's cover into the renditions used by srcset"""
+    book = Book.objects.filter(id=book_id).values('image', 'image_renditions').first()
+    if book is None:
+        return
+    name, previous = book['image'] or '', book['image_renditions']
+    if is_current(name, previous) or (not name and not previous):
+        return
+
+    renditions = generate_renditions(name) if name else {}
+    if previous:
+        delete_renditions(previous)
+    # Skip the write if the cover was replaced again meanwhile; that
+    # change queued its own task.
+    if Book.objects.filter(id=book_id, image=book['image']).update(
+        image_renditions=renditions, updated_at=timezone.now(),
+    ):
+        bump_catalog_version()
+
+
+@task
+def save_search_index():
+    """Rewrite the search index file after books changed, so every worker reloads it"""
+    save_index()
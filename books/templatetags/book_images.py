@@ -0,0 +1,31 @@
+from django import template
+from django.templatetags.static import static
+
+from ..images import cover_url, srcset
+
+
+register = template.Library()
+
+# Matches the col-lg-3 / col-md-4 / col-sm-6 book card grid
+CARD_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, (min-width: 576px) 50vw, 100vw'
+
+
+@register.inclusion_tag('books/includes/book_cover.html')
+def book_cover(book, css_class='book-image', sizes=CARD_SIZES, width=320, lazy=True):
+    """
+    Responsive ``<img>`` for a book cover: WebP and JPEG renditions via
+    ``srcset`` once they exist, the original upload until then, and a local
+    placeholder for books without a cover. ``width`` picks the fallback
+    ``src`` for browsers that ignore ``srcset``.
+    """
+    name = book.image.name if book.image else ''
+    renditions = book.image_renditions
+    return {
+        'title': book.title,
+        'css_class': css_class,
+        'sizes': sizes,
+        'lazy': lazy,
+        'src': cover_url(name, renditions, width) or static('images/book-placeholder.svg'),
+        'webp_srcset': srcset(name, renditions, 'webp'),
+        'jpeg_srcset': srcset(name, renditions, 'jpeg'),
+    }
@@ -0,0 +1,324 @@
+import io
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import inverted_index
+from .contact import ContactMessageBuffer
+from .export import accepts_gzip
+from .facets import facet_counts
+from .images import _storage, delete_renditions, generate_renditions, rendition_name
+from .importer import CatalogImporter
+from .management.commands.build_renditions import write_batch
+from .models import Book, Category, ContactMessage
+from .queries import catalog_books
+from .recommendations import compute_related_books
+
+
+# SQL queries each catalog endpoint issues. They are independent of how many
+# rows are returned, so an N+1 regression breaks them as soon as the catalog
+# holds more than a handful of books. Requests are made with a cart in the
+# session, so HTML pages include one cart lookup and DRF endpoints one
+# session load (for SessionAuthentication), except the public ones, which
+# don't authenticate (see books.conditional). The cache is cleared before each
+# request, so cached catalog lookups (including the conditional GET
+# validators) are counted as misses.
+QUERY_BUDGETS = {
+    'books:home': 3,
+    'books:book_list': 6,
+    'books:book_detail': 3,
+    'books:search_books': 3,
+    'books:cart_view': 1,
+    'book-list': 6,
+    'book-detail': 2,
+    'category-list': 3,
+    'featured-books-api': 3,
+    'book-detail-api': 2,
+    'cart-api': 3,
+}
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=name) for name in ('Fiction', 'Mystery', 'Science')]
+        for i in range(30):
+            Book.objects.create(
+                title=f'Dragon Book {i}',
+                author=f'Author {i % 5}',
+                description=f'A tale of dragons, number {i}',
+                price=100 + i * 10,
+                stock=10,
+                category=categories[i % 3],
+            )
+        compute_related_books()
+        cls.book = Book.objects.available().first()
+        cls.category = categories[0]
+
+    def setUp(self):
+        for book in Book.objects.available()[:5]:
+            self.client.post(reverse('books:add_to_cart'), {'book_id': book.id})
+
+    def test_catalog_endpoints_stay_within_query_budgets(self):
+        book, category = self.book, self.category
+        urls = {
+            'books:home': reverse('books:home'),
+            'books:book_list': reverse('books:book_list') + f'?category={category.slug}',
+            'books:book_detail': reverse('books:book_detail', kwargs={'slug': book.slug}),
+            'books:search_books': reverse('books:search_books') + '?q=dragon',
+            'books:cart_view': reverse('books:cart_view'),
+            'book-list': reverse('book-list'),
+            'book-detail': reverse('book-detail', kwargs={'pk': book.pk}),
+            'category-list': reverse('category-list'),
+            'featured-books-api': reverse('featured-books-api'),
+            'book-detail-api': reverse('book-detail-api', kwargs={'slug': book.slug}),
+            'cart-api': reverse('cart-api'),
+        }
+        for name, url in urls.items():
+            with self.subTest(name, url=url):
+                cache.clear()
+                with self.assertNumQueries(QUERY_BUDGETS[name]):
+                    response = self.client.get(url, HTTP_ACCEPT='application/json,text/html')
+                self.assertEqual(response.status_code, 200)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Restocked', author='A', description='d', price=100, stock=1)
+
+    def test_selling_out_and_restocking(self):
+        book = Book.objects.get(id=self.book.id)
+        book.stock = 0
+        book.save()
+        self.assertFalse(Book.objects.get(id=book.id).is_available)
+
+        book = Book.objects.get(id=book.id)
+        book.stock = 5
+        book.save(update_fields=['stock'])
+        self.assertTrue(Book.objects.get(id=book.id).is_available)
+
+    def test_books_hidden_by_hand_stay_hidden(self):
+        Book.objects.filter(id=self.book.id).update(is_available=False)
+        book = Book.objects.get(id=self.book.id)
+        book.stock = 5
+        book.save()
+        self.assertFalse(Book.objects.get(id=book.id).is_available)
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Gone Soon', author='A', description='d', price=100, stock=5)
+        self.client.post(reverse('books:add_to_cart'), {'book_id': self.book.id})
+
+    def test_updating_a_deleted_book_drops_it_from_the_cart(self):
+        book_id = self.book.id
+        self.book.delete()
+        response = self.client.post(reverse('books:update_cart'), {'book_id': book_id, 'quantity': 2}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'no longer available')
+        self.assertEqual(self.client.get(reverse('cart-api')).json()['items'], [])
+
+    def test_adding_less_than_one_copy_is_rejected(self):
+        for quantity in (0, -3, 'two'):
+            with self.subTest(quantity=quantity):
+                response = self.client.post(
+                    reverse('books:add_to_cart'), {'book_id': self.book.id, 'quantity': quantity}, follow=True
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.client.get(reverse('cart-api')).json()['total_items'], 1)
+
+    def test_reservations_never_exceed_stock(self):
+        response = self.client.post(reverse('books:add_to_cart'), {'book_id': self.book.id, 'quantity': 5}, follow=True)
+        self.assertContains(response, 'left in stock')
+        self.assertEqual(self.client.get(reverse('cart-api')).json()['total_items'], 1)
+
+
+class ImporterTests(TestCase):
+    def import_rows(self, rows, **options):
+        importer = CatalogImporter(**options)
+        importer.import_rows(rows)
+        return importer
+
+    def test_books_with_the_same_title_slug_are_kept_apart(self):
+        self.import_rows([
+            {'title': 'Dune', 'author': 'Frank Herbert', 'price': '500'},
+            {'title': 'Dune!', 'author': 'Someone Else', 'price': '300'},
+        ])
+        self.import_rows([{'title': 'Dune', 'author': 'Frank Herbert', 'price': '550'}])
+        self.assertEqual(
+            sorted(Book.objects.values_list('slug', 'author', 'price')),
+            [('dune', 'Frank Herbert', Decimal('550.00')), ('dune-2', 'Someone Else', Decimal('300.00'))],
+        )
+
+    def test_category_with_a_taken_slug_is_created(self):
+        Category.objects.create(name='Sci Fi', slug='sci-fi')
+        self.import_rows([{'title': 'Dune', 'author': 'Frank Herbert', 'price': '500', 'category': 'Sci-Fi'}])
+        self.assertEqual(Book.objects.get().category.slug, 'sci-fi-2')
+
+    def test_existing_books_can_be_left_untouched(self):
+        self.import_rows([{'title': 'Dune', 'author': 'Frank Herbert', 'price': '500', 'stock': '3'}])
+        importer = self.import_rows(
+            [{'title': 'Dune', 'author': 'Frank Herbert', 'price': '400'}], update_existing=False,
+        )
+        self.assertEqual(importer.skipped, 1)
+        self.assertEqual(Book.objects.values_list('price', 'stock').get(), (Decimal('500.00'), 3))
+
+
+@override_settings(CATALOG_EXPORT_TOKEN='export-me')
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_export_needs_staff_or_the_token(self):
+        url = reverse('export-catalog')
+        self.assertEqual(self.client.get(url, {'available': '0'}).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer export-me').status_code, 200)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_exports_are_throttled(self):
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        statuses = [self.client.get(reverse('export-catalog')).status_code for _ in range(11)]
+        self.assertEqual(statuses, [200] * 10 + [429])
+
+    def test_gzip_is_negotiated_with_quality_values(self):
+        self.assertTrue(accepts_gzip('gzip, deflate'))
+        self.assertTrue(accepts_gzip('br;q=1.0, gzip;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip('gzip;q=0, *'))
+        self.assertFalse(accepts_gzip('identity'))
+        self.assertFalse(accepts_gzip(''))
+
+
+class ConditionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Dune', author='Frank Herbert', description='d', price=500, stock=5)
+
+    def test_public_api_responses_do_not_vary_on_cookie(self):
+        self.client.post(reverse('books:add_to_cart'), {'book_id': self.book.id})
+        for url in (reverse('featured-books-api'), reverse('book-detail-api', args=[self.book.slug])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertNotIn('Cookie', response['Vary'])
+
+    def test_book_page_etag_changes_with_the_csrf_secret(self):
+        url = reverse('books:book_detail', args=[self.book.slug])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.cookies.pop('csrftoken')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class RenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        overrides = self.settings(MEDIA_ROOT=media_root, BOOK_IMAGE_WIDTHS=(8,))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def save_cover(self, name, image_format):
+        buffer = io.BytesIO()
+        Image.new('RGB', (16, 16), 'red').save(buffer, image_format)
+        return _storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_covers_with_the_same_stem_keep_their_own_renditions(self):
+        jpeg = generate_renditions(self.save_cover('books/cover.jpg', 'JPEG'))
+        png = generate_renditions(self.save_cover('books/cover.png', 'PNG'))
+        self.assertNotEqual(rendition_name(jpeg['source'], 8, 'webp'), rendition_name(png['source'], 8, 'webp'))
+
+        delete_renditions(jpeg)
+        self.assertFalse(_storage.exists(rendition_name(jpeg['source'], 8, 'webp')))
+        self.assertTrue(_storage.exists(rendition_name(png['source'], 8, 'webp')))
+
+    def test_build_renditions_leaves_covers_replaced_meanwhile_alone(self):
+        old = generate_renditions(self.save_cover('books/old.jpg', 'JPEG'))
+        book = Book.objects.create(title='Dune', author='A', description='d', price=1, image='books/new.jpg')
+        self.assertEqual(write_batch({book.id: ('books/old.jpg', old)}, {book.id: {}}), 0)
+        book.refresh_from_db()
+        self.assertEqual(book.image_renditions, {})
+        self.assertFalse(_storage.exists(rendition_name('books/old.jpg', 8, 'webp')))
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        fiction = Category.objects.create(name='Fiction')
+        poetry = Category.objects.create(name='Poetry')
+        for number in range(12):
+            Book.objects.create(
+                title=f'Book {number}', author=f'Author {number % 3}', description='d',
+                price=100 + 150 * number, stock=number + 1, category=fiction if number % 2 else poetry,
+            )
+
+    def test_counts_match_the_listing_each_value_leads_to(self):
+        for selected in ({}, {'category': 'fiction'}, {'author': 'Author 1', 'price': '300-500'}):
+            for facet, values in facet_counts(None, selected).items():
+                for value in values:
+                    with self.subTest(selected=selected, facet=facet, value=value['value']):
+                        books = catalog_books(facets={**selected, facet: value['value']})
+                        self.assertEqual(value['count'], books.count())
+
+
+class ContactTests(TestCase):
+    def test_invalid_submissions_are_rejected(self):
+        data = {'name': 'x' * 101, 'email': 'reader@example.com', 'subject': 'Other', 'message': 'Hi'}
+        response = self.client.post(reverse('books:contact_page'), data)
+        self.assertContains(response, 'at most 100 characters')
+        self.assertFalse(ContactMessage.objects.exists())
+
+    def test_a_bad_row_is_dropped_without_holding_up_the_batch(self):
+        buffer = ContactMessageBuffer(max_size=10, interval=60)
+        buffer.add(ContactMessage(name='Good', email='good@example.com', subject='Other', message='Hi'))
+        buffer.add(ContactMessage(name='Bad', email='bad@example.com', subject='Other', message=None))
+        with self.assertLogs('books.contact', 'ERROR'):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(buffer.pending, [])
+        self.assertEqual(list(ContactMessage.objects.values_list('name', flat=True)), ['Good'])
+
+
+@override_settings(
+    BOOK_SEARCH_BACKEND='books.inverted_index.InvertedIndexSearchBackend',
+    BOOK_SEARCH_MAX_RESULTS=3,
+)
+class InvertedIndexTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        overrides = self.settings(BOOK_SEARCH_INDEX_PATH=f'{directory}/books.idx')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(setattr, inverted_index, '_index', None)
+        inverted_index._index = None
+
+    def test_the_result_cap_applies_after_narrowing_to_the_queryset(self):
+        for number in range(6):
+            Book.objects.create(title=f'Dragon {number}', author='A', description='d', price=1, stock=number % 2)
+        inverted_index.rebuild_index()
+        self.assertEqual(catalog_books(query='dragon').count(), 3)
+        self.assertEqual({book.stock for book in catalog_books(query='dragon')}, {1})
+
+    def test_saving_applies_changes_made_elsewhere(self):
+        kept = Book.objects.create(title='Dragon', author='A', description='d', price=1)
+        gone = Book.objects.create(title='Wizard', author='A', description='d', price=1)
+        index = inverted_index.rebuild_index()
+        # Changes another process made, which this one's index hasn't seen
+        Book.objects.filter(id=kept.id).update(title='Mermaid', updated_at=timezone.now())
+        Book.objects.filter(id=gone.id)._raw_delete('default')
+
+        self.assertIs(inverted_index.save_index(), index)
+        loaded = inverted_index.InvertedIndex.load(settings.BOOK_SEARCH_INDEX_PATH)
+        self.assertEqual([book_id for book_id, _ in loaded.search('mermaid')], [kept.id])
+        self.assertEqual(loaded.search('dragon'), [])
+        self.assertEqual(loaded.search('wizard'), [])
@@ -1,31 +1,38 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.db.models import Q
-from django.http import JsonResponse
+from django.http import Http404
 from django.views.decorators.http import require_POST
-from .models import Book, Category
-from decimal import Decimal
+from .cache import catalog_version, get_book_detail, get_book_validators, get_categories, get_featured_books
+from .cache import timeout as catalog_cache_timeout
+from .cart import BookRemoved, Cart
+from .conditional import private_page
+from .contact import submit_contact_message
+from .facets import facet_counts, facet_links, selected_facets
+from .forms import ContactForm
+from .inventory import OutOfStock
+from .models import Book
+from .pagination import paginate_catalog
+from .queries import catalog_books
 
 
 def home(request):
     """Homepage with featured books"""
-    featured_books = Book.objects.filter(is_available=True).order_by('-created_at')[:12]
-    categories = Category.objects.all()
-    
     context = {
-        'featured_books': featured_books,
-        'categories': categories,
+        'featured_books': get_featured_books(),
+        'categories': get_categories(),
+        'catalog_version': catalog_version(),
+        'catalog_cache_timeout': catalog_cache_timeout(),
     }
     return render(request, 'books/home.html', context)
 
 
+@private_page(lambda slug: get_book_validators(slug, with_related=True))
 def book_detail(request, slug):
     """Book details page"""
-    book = get_object_or_404(Book, slug=slug, is_available=True)
-    related_books = Book.objects.filter(
-        category=book.category, 
-        is_available=True
-    ).exclude(id=book.id)[:4]
+    detail = get_book_detail(slug)
+    if detail is None:
+        raise Http404('No Book matches the given query.')
+    book, related_books = detail
     
     context = {
         'book': book,
@@ -36,55 +43,49 @@ def book_detail(request, slug):
 
 def book_list(request):
     """List all books with filtering"""
-    books = Book.objects.filter(is_available=True)
-    categories = Category.objects.all()
-    
-    category_slug = request.GET.get('category')
     search_query = request.GET.get('search')
+    selected = selected_facets(request.GET)
+    books = catalog_books(query=search_query, facets=selected)
     
-    if category_slug:
-        books = books.filter(category__slug=category_slug)
-    
-    if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+    page, pagination = paginate_catalog(request, books)
     
     context = {
-        'books': books,
-        'categories': categories,
-        'selected_category': category_slug,
+        'books': page,
+        'facets': facet_links(facet_counts(search_query, selected), request.GET),
+        'selected_facets': selected,
+        'selected_category': selected.get('category'),
         'search_query': search_query or '',
+        **pagination,
     }
     return render(request, 'books/book_list.html', context)
 
 
+def _quantity(request):
+    """The posted ``quantity`` (default 1), or ``None`` if it isn't a number"""
+    try:
+        return int(request.POST.get('quantity', 1))
+    except (TypeError, ValueError):
+        return None
+
+
 @require_POST
 def add_to_cart(request):
     """Add book to cart"""
     book_id = str(request.POST.get('book_id'))
-    quantity = int(request.POST.get('quantity', 1))
+    quantity = _quantity(request)
     
     book = get_object_or_404(Book, id=book_id, is_available=True)
     
-    cart = request.session.get('cart', {})
+    if quantity is None or quantity < 1:
+        messages.error(request, 'Please choose at least one copy.')
+        return redirect('books:book_detail', slug=book.slug)
     
-    if book_id in cart:
-        cart[book_id]['quantity'] += quantity
+    try:
+        Cart.for_request(request).add(book, quantity)
+    except OutOfStock as exc:
+        messages.error(request, str(exc))
     else:
-        cart[book_id] = {
-            'title': book.title,
-            'author': book.author,
-            'price': str(book.price),
-            'quantity': quantity,
-            'image': book.image.url if book.image else None,
-        }
-    
-    request.session['cart'] = cart
-    request.session.modified = True
-    messages.success(request, f'"{book.title}" added to cart!')
+        messages.success(request, f'"{book.title}" added to cart!')
     
     return redirect('books:book_detail', slug=book.slug)
 
@@ -93,18 +94,18 @@ def add_to_cart(request):
 def update_cart(request):
     """Update cart item quantity"""
     book_id = str(request.POST.get('book_id'))
-    quantity = int(request.POST.get('quantity', 1))
+    quantity = _quantity(request)
     
-    cart = request.session.get('cart', {})
+    if quantity is None:
+        messages.error(request, 'Please enter a valid quantity.')
+        return redirect('books:cart_view')
     
-    if book_id in cart:
-        if quantity > 0:
-            cart[book_id]['quantity'] = quantity
-        else:
-            del cart[book_id]
-        
-        request.session['cart'] = cart
-        request.session.modified = True
+    try:
+        Cart.for_request(request).update(book_id, quantity)
+    except OutOfStock as exc:
+        messages.error(request, str(exc))
+    except BookRemoved as exc:
+        messages.warning(request, str(exc))
     
     return redirect('books:cart_view')
 
@@ -114,12 +115,7 @@ def remove_from_cart(request):
     """Remove item from cart"""
     book_id = str(request.POST.get('book_id'))
     
-    cart = request.session.get('cart', {})
-    
-    if book_id in cart:
-        del cart[book_id]
-        request.session['cart'] = cart
-        request.session.modified = True
+    if Cart.for_request(request).remove(book_id):
         messages.success(request, 'Item removed from cart!')
     
     return redirect('books:cart_view')
@@ -127,31 +123,12 @@ def remove_from_cart(request):
 
 def cart_view(request):
     """Shopping cart page"""
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total_price = Decimal('0.00')
-    
-    for book_id, item in cart.items():
-        quantity = int(item['quantity'])
-        price = Decimal(item['price'])
-        item_total = price * quantity
-        total_price += item_total
-        
-        cart_item = {
-            'book_id': book_id,
-            'title': item['title'],
-            'author': item['author'],
-            'price': price,
-            'quantity': quantity,
-            'image': item['image'],
-            'item_total': item_total,
-        }
-        cart_items.append(cart_item)
+    cart = Cart.for_request(request)
     
     context = {
-        'cart_items': cart_items,
-        'total_price': total_price,
-        'cart_count': sum(int(item['quantity']) for item in cart.values()),
+        'cart_items': cart.lines(),
+        'total_price': cart.total(),
+        'cart_count': cart.count(),
     }
     
     return render(request, 'books/cart.html', context)
@@ -160,18 +137,14 @@ def cart_view(request):
 def search_books(request):
     """Search books"""
     query = request.GET.get('q', '')
-    books = Book.objects.filter(is_available=True)
+    books = catalog_books(query=query)
     
-    if query:
-        books = books.filter(
-            Q(title__icontains=query) |
-            Q(author__icontains=query) |
-            Q(description__icontains=query)
-        )
+    page, pagination = paginate_catalog(request, books)
     
     context = {
-        'books': books,
+        'books': page,
         'query': query,
+        **pagination,
     }
     
     return render(request, 'books/search_results.html', context)
@@ -189,25 +162,18 @@ def about_page(request):
 def contact_page(request):
     """Contact Us page"""
     if request.method == 'POST':
-        name = request.POST.get('name', '')
-        email = request.POST.get('email', '')
-        subject = request.POST.get('subject', '')
-        message = request.POST.get('message', '')
-        
-        # Save contact message to database
-        from .models import ContactMessage
-        ContactMessage.objects.create(
-            name=name,
-            email=email,
-            subject=subject,
-            message=message
-        )
-        
-        # Here you would typically send an email notification
-        # send_email_notification(name, email, subject, message)
+        form = ContactForm(request.POST)
+        if form.is_valid():
+            # Saved in batches by a background writer, which also queues the
+            # staff email notification
+            submit_contact_message(**form.cleaned_data)
+            
+            messages.success(request, 'Thank you for contacting us! We will get back to you soon.')
+            return redirect('books:contact_page')
         
-        messages.success(request, 'Thank you for contacting us! We will get back to you soon.')
-        return redirect('books:contact_page')
+        for field, errors in form.errors.items():
+            for error in errors:
+                messages.error(request, f'{form.fields[field].label}: {error}')
     
     context = {
         'title': 'Contact Us',
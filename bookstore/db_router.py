@@ -0,0 +1,194 @@
+"""
+Read-replica routing for catalog queries.
+
+``ReplicaRouter`` sends reads of the catalog models (``CATALOG_MODELS``) made
+while serving a ``GET``/``HEAD`` request to one of the aliases in
+``settings.DATABASE_REPLICAS``; everything else, including every write and
+all work outside requests (management commands, task workers), uses the
+primary (``default``).
+
+* Replicas are picked round-robin, once per request, so a page never mixes
+  data from replicas at different points of replication.
+* Every ``REPLICA_CHECK_INTERVAL`` seconds a replica's lag is checked;
+  replicas more than ``REPLICA_MAX_LAG`` seconds behind (or unreachable)
+  are skipped, and with none left reads fall back to the primary.
+* A request that writes is pinned to the primary for the rest of the
+  request, and ``ReplicaPinningMiddleware`` sets a short-lived cookie so
+  the client's following requests (e.g. the redirect after adding to the
+  cart) read their own writes too.
+
+``read_from_primary()`` forces primary reads for a block of code, e.g. for
+values about to be stored in the shared cache (see ``books.cache``).
+``manage.py check_replica_routing`` verifies the routing against the
+configured databases; ``bookstore.tests`` covers it with a second SQLite
+database standing in for a replica.
+"""
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+
+PRIMARY = 'default'
+
+CATALOG_MODELS = {'books.book', 'books.category', 'books.categorystats', 'books.relatedbook'}
+
+# Writes that don't affect anything read from replicas
+UNPINNED_APPS = {'sessions'}
+
+PIN_COOKIE = 'db_pin'
+
+
+class RoutingState:
+    """Routing decisions for the request being served"""
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.replica = None
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing', default=None)
+_force_primary = contextvars.ContextVar('db_force_primary', default=False)
+
+
+@contextmanager
+def read_from_primary():
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Seconds ``alias`` is behind its primary, ``0`` for a database that
+    isn't replicating, or ``None`` if replication is stopped.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'mysql':
+        return 0.0
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except DatabaseError:
+            # Before MySQL 8.0.22
+            cursor.execute('SHOW SLAVE STATUS')
+        row = cursor.fetchone()
+        if row is None:
+            return 0.0
+        status = dict(zip([column[0] for column in cursor.description], row))
+    lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+    return None if lag is None else float(lag)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'DATABASE_REPLICAS', []))
+        self.max_lag = getattr(settings, 'REPLICA_MAX_LAG', 5.0)
+        self.check_interval = getattr(settings, 'REPLICA_CHECK_INTERVAL', 5.0)
+        self.next_replica = itertools.count()
+        self.lock = threading.Lock()
+        self.health = {}  # alias -> (checked at, usable)
+
+    def is_usable(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked, usable = self.health.get(alias, (None, True))
+            if checked is not None and now - checked < self.check_interval:
+                return usable
+            # Other threads keep the previous answer while this one checks
+            self.health[alias] = (now, usable)
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError:
+            lag = None
+        usable = lag is not None and lag <= self.max_lag
+        with self.lock:
+            self.health[alias] = (now, usable)
+        return usable
+
+    def choose_replica(self):
+        usable = [alias for alias in self.replicas if self.is_usable(alias)]
+        if not usable:
+            return PRIMARY
+        return usable[next(self.next_replica) % len(usable)]
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None
+            or not state.use_replicas
+            or _force_primary.get()
+            or model._meta.label_lower not in CATALOG_MODELS
+        ):
+            return PRIMARY
+        if state.replica is None:
+            state.replica = self.choose_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label not in UNPINNED_APPS:
+            state.wrote = True
+            state.use_replicas = False
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *self.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """Scope ``ReplicaRouter`` decisions to the request, and pin clients that wrote to the primary"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        # The state object is shared with the threads the async ORM runs in
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    def start(self, request):
+        return RoutingState(
+            use_replicas=request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES,
+        )
+
+    def finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
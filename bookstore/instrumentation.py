@@ -0,0 +1,284 @@
+"""
+Per-request performance instrumentation.
+
+``RequestMetricsMiddleware`` records, for every request, the number of SQL
+queries, time spent in the database, time spent rendering templates and
+total latency. The figures are aggregated per resolved URL name into
+in-process histograms, which ``metrics_view`` (``/api/_metrics``) exposes
+to staff and to scrapers holding ``METRICS_TOKEN`` in the Prometheus text
+format with p50/p95/p99 estimates. With ``METRICS_SERVER_TIMING`` they are
+also sent back in a ``Server-Timing`` header. ``METRICS_ENABLED = False``
+turns all of it off.
+
+Template render time is captured by ``InstrumentedDjangoTemplates``, a
+drop-in replacement for the ``DjangoTemplates`` backend.
+
+The middleware supports both sync and async requests, so under ASGI it
+doesn't force async views (``books.async_api``) onto a thread.
+"""
+import bisect
+import contextvars
+import hmac
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Upper bounds for latency buckets, in seconds (0.5ms .. 30s)
+TIME_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.025, 0.035, 0.05,
+    0.075, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75, 1.0, 1.5, 2.5, 5.0, 10.0, 30.0,
+)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 75, 100, 200, 500)
+
+
+class Histogram:
+    """Fixed-bucket histogram with interpolated quantile estimates"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+METRICS = (
+    ('request_duration_seconds', 'Total request latency', TIME_BUCKETS),
+    ('db_duration_seconds', 'Time spent executing SQL', TIME_BUCKETS),
+    ('template_duration_seconds', 'Time spent rendering templates', TIME_BUCKETS),
+    ('db_queries', 'SQL queries per request', QUERY_BUCKETS),
+)
+
+
+class MetricsRegistry:
+    """Per-view histograms for every metric in ``METRICS``"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.collectors = []
+
+    def observe(self, view_name, values):
+        with self.lock:
+            histograms = self.views.get(view_name)
+            if histograms is None:
+                histograms = self.views[view_name] = {
+                    name: Histogram(buckets) for name, _, buckets in METRICS
+                }
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+    def register_collector(self, collector):
+        """
+        Add a callable returning extra Prometheus text lines to include in
+        the exposition (e.g. connection pool gauges).
+        """
+        self.collectors.append(collector)
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self, prefix='bookstore'):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, help_text, _ in METRICS:
+                metric = f'{prefix}_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} summary')
+                for view_name, histograms in sorted(self.views.items()):
+                    histogram = histograms[name]
+                    label = f'view="{view_name}"'
+                    for q in QUANTILES:
+                        lines.append(f'{metric}{{{label},quantile="{q}"}} {histogram.quantile(q):.6g}')
+                    lines.append(f'{metric}_sum{{{label}}} {histogram.sum:.6g}')
+                    lines.append(f'{metric}_count{{{label}}} {histogram.count}')
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper hook timing each query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings(execute, sql, params, many, context)
+
+
+def instrument_connection(connection, **kwargs):
+    """
+    Time the queries ``connection`` runs for the request being recorded.
+    Installed on every new connection (``connection_created``) rather than
+    around each request: async views run their queries on connections that
+    belong to the async ORM's worker thread, out of the middleware's reach,
+    while the request's ``_current`` context is carried over to it.
+    """
+    if _timed_execute not in connection.execute_wrappers:
+        # First, so execute_wrapper() blocks still pop their own wrapper
+        connection.execute_wrappers.insert(0, _timed_execute)
+
+
+connection_created.connect(instrument_connection)
+
+
+class RequestMetricsMiddleware:
+    """Record query count, DB time, template time and latency per view"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'METRICS_SERVER_TIMING', settings.DEBUG)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Covers connections opened before this module was imported
+        for connection in connections.all():
+            instrument_connection(connection)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, timings, time.perf_counter() - start)
+
+    def record(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else 'unresolved'
+        registry.observe(view_name, {
+            'request_duration_seconds': total,
+            'db_duration_seconds': timings.db_time,
+            'template_duration_seconds': timings.template_time,
+            'db_queries': timings.queries,
+        })
+
+        if not self.server_timing:
+            return response
+        response['Server-Timing'] = ', '.join([
+            f'db;desc="{timings.queries} queries";dur={timings.db_time * 1000:.1f}',
+            f'tpl;dur={timings.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        return response
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+
+        # Nested renders (e.g. {% include %} through the backend) are
+        # already covered by the outermost one.
+        timings.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_depth -= 1
+            if not timings.template_depth:
+                timings.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` backend whose templates report render time"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _can_read_metrics(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+    return request.user.is_active and request.user.is_staff
+
+
+def metrics_view(request):
+    """Expose collected metrics in the Prometheus text format (staff or ``METRICS_TOKEN`` only)"""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        return HttpResponseNotFound()
+    if not _can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
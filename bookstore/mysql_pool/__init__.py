@@ -0,0 +1,15 @@
+"""
+MySQL database backend with an in-process connection pool.
+
+Set ``ENGINE`` to ``bookstore.mysql_pool`` (``DB_POOL=True`` in the
+environment) to have connections returned to a per-process pool when
+Django closes them at the end of a request, instead of being torn down,
+and handed to the next request that needs one. Pool limits are read from
+the database's ``POOL`` setting (see ``pool.DEFAULTS``). Use it with
+``CONN_MAX_AGE = 0``: the pool, not the request thread, keeps connections
+open, so they are shared between threads and survive async (ASGI)
+requests, whose connections Django never reuses.
+
+Pool gauges, counters and checkout wait times are included in
+``/api/_metrics`` (see ``pool.collect_pool_metrics``).
+"""
@@ -0,0 +1,37 @@
+from django.db.backends.mysql.base import Database, DatabaseWrapper as MySQLDatabaseWrapper
+
+from .pool import PoolTimeout, get_pool
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    """MySQL backend checking connections out of, and back into, a ``ConnectionPool``"""
+
+    @property
+    def pool(self):
+        return get_pool(
+            self.alias,
+            self.settings_dict.get('POOL'),
+            health_checks=self.settings_dict['CONN_HEALTH_CHECKS'],
+        )
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as exc:
+            # Surfaces as django.db.OperationalError
+            raise Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # A connection closed mid-transaction stays referenced by this
+        # wrapper (Django rolls back on the next connect), so it can't be
+        # shared; nor can one broken by an error.
+        discard = self.in_atomic_block or (self.errors_occurred and not self.is_usable())
+        if not discard and not self.autocommit:
+            try:
+                with self.wrap_database_errors:
+                    self.connection.rollback()
+            except Exception:
+                discard = True
+        self.pool.release(self.connection, discard=discard)
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from collections import deque
+
+from bookstore.instrumentation import TIME_BUCKETS, Histogram, QUANTILES, registry
+
+
+DEFAULTS = {
+    'SIZE': 10,             # connections kept open while idle
+    'MAX_OVERFLOW': 10,     # extra connections opened under load, closed when returned
+    'TIMEOUT': 10.0,        # seconds to wait for a free connection before giving up
+    'RECYCLE': 3600,        # seconds after which a connection is replaced
+    'PING_AFTER': 5.0,      # ping connections idle for longer than this before reuse
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections.
+
+    Up to ``SIZE`` connections stay open between requests; under load up to
+    ``MAX_OVERFLOW`` more are opened and closed again when returned. When
+    all of them are checked out, ``acquire()`` waits up to ``TIMEOUT``
+    seconds and then raises ``PoolTimeout``. With ``health_checks``,
+    connections that sat idle for ``PING_AFTER`` seconds are pinged before
+    being handed out, and dead ones are replaced.
+    """
+
+    def __init__(self, alias, options=None, health_checks=True):
+        options = {**DEFAULTS, **(options or {})}
+        self.alias = alias
+        self.size = options['SIZE']
+        self.max_overflow = options['MAX_OVERFLOW']
+        self.timeout = options['TIMEOUT']
+        self.recycle = options['RECYCLE']
+        self.ping_after = options['PING_AFTER'] if health_checks else None
+        self.condition = threading.Condition()
+        self.idle = deque()   # (connection, created, returned)
+        self.created = {}     # id(connection) -> creation time, for checked-out ones
+        self.open = 0
+        self.pid = os.getpid()
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.opened = 0
+        self.discarded = 0
+        self.wait = Histogram(TIME_BUCKETS)
+
+    def _check_pid(self):
+        # A forked child must not use (or close) its parent's sockets
+        if self.pid != os.getpid():
+            _inherited.extend(self.idle)
+            self.idle.clear()
+            self.created.clear()
+            self.open = 0
+            self.pid = os.getpid()
+
+    def _available(self):
+        return self.idle or self.open < self.size + self.max_overflow
+
+    def acquire(self, connect):
+        """Check out an idle connection, or open one with ``connect()`` if there is room"""
+        start = time.perf_counter()
+        with self.condition:
+            self._check_pid()
+            if not self.condition.wait_for(self._available, self.timeout):
+                self.timeouts += 1
+                raise PoolTimeout(
+                    f'No connection available in the {self.alias!r} pool within {self.timeout}s '
+                    f'({self.size} + {self.max_overflow} overflow in use)'
+                )
+            if self.idle:
+                connection, created, returned = self.idle.pop()
+            else:
+                # Take the slot now; the connection is opened outside the lock
+                connection = created = returned = None
+                self.open += 1
+            self.checkouts += 1
+            self.wait.observe(time.perf_counter() - start)
+
+        now = time.monotonic()
+        if connection is not None and (
+            now - created > self.recycle
+            or (self.ping_after is not None and now - returned > self.ping_after and not self._alive(connection))
+        ):
+            self._close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = connect()
+            except BaseException:
+                with self.condition:
+                    self.open -= 1
+                    self.condition.notify()
+                raise
+            created = now
+            with self.condition:
+                self.opened += 1
+        with self.condition:
+            self.created[id(connection)] = created
+        return connection
+
+    def release(self, connection, discard=False):
+        """Return a connection; ``discard`` closes it instead (e.g. after errors)"""
+        with self.condition:
+            if self.pid != os.getpid():
+                return
+            created = self.created.pop(id(connection), None)
+            if created is None:
+                return
+            keep = (
+                not discard
+                and len(self.idle) < self.size
+                and time.monotonic() - created <= self.recycle
+            )
+            if keep:
+                self.idle.append((connection, created, time.monotonic()))
+            else:
+                self.open -= 1
+            self.condition.notify()
+        if not keep:
+            self._close(connection)
+
+    def _alive(self, connection):
+        try:
+            connection.ping()
+        except Exception:
+            return False
+        return True
+
+    def _close(self, connection):
+        with self.condition:
+            self.discarded += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self.condition:
+            in_use = self.open - len(self.idle)
+            return {
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': in_use,
+                'overflow': max(0, self.open - self.size),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'opened': self.opened,
+                'discarded': self.discarded,
+            }
+
+
+# Connections a forked child inherited; kept referenced so they are never
+# garbage-collected (and closed) from the child
+_inherited = []
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options=None, health_checks=True):
+    """The process-wide pool for database ``alias``, created on first use"""
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(alias, options, health_checks)
+        return pool
+
+
+def collect_pool_metrics(prefix='bookstore'):
+    """Prometheus text lines for every pool (see ``MetricsRegistry.register_collector``)"""
+    with _pools_lock:
+        pools = sorted(_pools.items())
+    if not pools:
+        return []
+    lines = []
+    gauges = (
+        ('connections', 'Pooled connections by state', ('idle', 'in_use')),
+        ('overflow', 'Connections open beyond the pool size', None),
+    )
+    counters = (
+        ('checkouts', 'Connections handed out'),
+        ('timeouts', 'Checkouts that gave up waiting for a connection'),
+        ('opened', 'Connections opened'),
+        ('discarded', 'Connections closed (overflow, recycled, failed health checks or errors)'),
+    )
+    stats = {alias: pool.stats() for alias, pool in pools}
+    for name, help_text, states in gauges:
+        metric = f'{prefix}_db_pool_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        for alias, values in stats.items():
+            if states:
+                for state in states:
+                    lines.append(f'{metric}{{alias="{alias}",state="{state}"}} {values[state]}')
+            else:
+                lines.append(f'{metric}{{alias="{alias}"}} {values[name]}')
+    for name, help_text in counters:
+        metric = f'{prefix}_db_pool_{name}_total'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for alias, values in stats.items():
+            lines.append(f'{metric}{{alias="{alias}"}} {values[name]}')
+
+    metric = f'{prefix}_db_pool_wait_seconds'
+    lines.append(f'# HELP {metric} Time spent waiting for a connection')
+    lines.append(f'# TYPE {metric} summary')
+    for alias, pool in pools:
+        with pool.condition:
+            label = f'alias="{alias}"'
+            for q in QUANTILES:
+                lines.append(f'{metric}{{{label},quantile="{q}"}} {pool.wait.quantile(q):.6g}')
+            lines.append(f'{metric}_sum{{{label}}} {pool.wait.sum:.6g}')
+            lines.append(f'{metric}_count{{{label}}} {pool.wait.count}')
+    return lines
+
+
+registry.register_collector(collect_pool_metrics)
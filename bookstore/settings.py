@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'books',
     'orders',
+    'taskqueue',
 ]
 
 # REST Framework Configuration
@@ -50,7 +52,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'books.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -61,6 +63,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'bookstore.instrumentation.RequestMetricsMiddleware',
+    'bookstore.db_router.ReplicaPinningMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -75,7 +79,7 @@ ROOT_URLCONF = 'bookstore.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'bookstore.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -104,9 +108,100 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD', default=''),
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='3306'),
+        # Keep each thread's connection open between requests, checking it
+        # still works before reusing it
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Or share connections between threads through an in-process pool (see
+# bookstore.mysql_pool); the pool then keeps them open instead of CONN_MAX_AGE
+if config('DB_POOL', default=False, cast=bool):
+    DATABASES['default'].update({
+        'ENGINE': 'bookstore.mysql_pool',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'SIZE': config('DB_POOL_SIZE', default=10, cast=int),
+            'MAX_OVERFLOW': config('DB_POOL_MAX_OVERFLOW', default=10, cast=int),
+            'TIMEOUT': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+            'RECYCLE': config('DB_POOL_RECYCLE', default=3600, cast=int),
+        },
+    })
+
+# Read replicas for catalog pages and APIs (see bookstore.db_router), as a
+# comma-separated list of host[:port][/database] with the primary's
+# credentials, e.g. DB_REPLICAS=replica1.internal,replica2.internal:3307
+DATABASE_REPLICAS = []
+for number, replica in enumerate(config('DB_REPLICAS', default='', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()]), 1):
+    address, _, name = replica.partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['bookstore.db_router.ReplicaRouter'] if DATABASE_REPLICAS else []
+# `manage.py test` gets a second, SQLite database to route reads to, so the
+# routing tests (bookstore.tests) don't need real replicas
+if sys.argv[1:2] == ['test'] and 'replica' not in DATABASES:
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'}
+REPLICA_MAX_LAG = config('DB_REPLICA_MAX_LAG', default=5.0, cast=float)  # seconds
+REPLICA_CHECK_INTERVAL = 5  # seconds between lag checks
+REPLICA_PIN_SECONDS = 10  # primary-only reads for a client after it writes
+
+
+# Catalog search backend (dotted path). Leave empty to pick one from the
+# database vendor: MySQL FULLTEXT, SQLite FTS5, or an icontains fallback.
+BOOK_SEARCH_BACKEND = config('BOOK_SEARCH_BACKEND', default='')
+
+# Used by books.inverted_index.InvertedIndexSearchBackend
+BOOK_SEARCH_INDEX_PATH = config('BOOK_SEARCH_INDEX_PATH', default=str(BASE_DIR / 'var' / 'books.idx'))
+BOOK_SEARCH_MAX_RESULTS = config('BOOK_SEARCH_MAX_RESULTS', default=500, cast=int)
+# Seconds to wait before rewriting the index file after books change
+BOOK_SEARCH_INDEX_SAVE_DELAY = config('BOOK_SEARCH_INDEX_SAVE_DELAY', default=10, cast=int)
+
+# Cache backend: locmem (default), file, or redis (any Redis-compatible server)
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'bookstore'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'var' / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        'KEY_PREFIX': 'bookstore',
+    }
+}
+
+# Cached featured books, categories and book pages (see books.cache)
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=600, cast=int)
+
+# Catalog listings use keyset pagination (see books.pagination)
+CATALOG_PAGE_SIZE = 24
+CATALOG_COUNT_CACHE_TIMEOUT = 60  # seconds
+
+# Related books stored per book by `manage.py compute_related_books`
+RELATED_BOOKS_LIMIT = 8
+
+# How long CDNs/proxies may serve catalog API responses without
+# revalidating them (see books.conditional)
+CATALOG_HTTP_MAX_AGE = config('CATALOG_HTTP_MAX_AGE', default=60, cast=int)
+CATALOG_HTTP_STALE_WHILE_REVALIDATE = 300
+
+# Serve the read-only catalog API from async views (books.async_api); only
+# worth it when running under an ASGI server (bookstore.asgi)
+CATALOG_ASYNC_API = config('CATALOG_ASYNC_API', default=False, cast=bool)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -152,6 +247,10 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Widths (px) of the WebP/JPEG cover renditions used in srcset (see books.images)
+BOOK_IMAGE_WIDTHS = (160, 320, 640)
+BOOK_IMAGE_QUALITY = 80
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -163,11 +262,25 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'books.renderers.FastJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    'DEFAULT_THROTTLE_RATES': {
+        'catalog_export': config('CATALOG_EXPORT_RATE', default='10/hour'),
+    },
 }
 
+# /api/export/ is open to staff and to clients sending
+# "Authorization: Bearer <CATALOG_EXPORT_TOKEN>"
+CATALOG_EXPORT_TOKEN = config('CATALOG_EXPORT_TOKEN', default='')
+
+# Request metrics, readable at /api/_metrics by staff or with
+# "Authorization: Bearer <METRICS_TOKEN>" (e.g. for Prometheus)
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Also send each request's timings in a Server-Timing header
+METRICS_SERVER_TIMING = config('METRICS_SERVER_TIMING', default=DEBUG, cast=bool)
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8000",
@@ -178,7 +291,26 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Session settings
 SESSION_COOKIE_AGE = 86400  # 24 hours
-SESSION_SAVE_EVERY_REQUEST = True
+# Sessions are only written when they change; the cart has its own table
+SESSION_SAVE_EVERY_REQUEST = False
+
+# How long copies added to a cart stay reserved for that shopper
+CART_RESERVATION_MINUTES = config('CART_RESERVATION_MINUTES', default=15, cast=int)
+
+# Email
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='Online Bookstore <noreply@bookstore.local>')
+
+# Background tasks (run with `manage.py run_workers`). With TASKS_EAGER the
+# tasks run inside the request instead, so no worker is needed.
+TASKS_EAGER = config('TASKS_EAGER', default=False, cast=bool)
+TASK_CLAIM_TIMEOUT = 300
+
+# Contact form submissions are written in batches of up to
+# CONTACT_BUFFER_SIZE, at least every CONTACT_FLUSH_INTERVAL seconds
+CONTACT_BUFFER_SIZE = config('CONTACT_BUFFER_SIZE', default=50, cast=int)
+CONTACT_FLUSH_INTERVAL = config('CONTACT_FLUSH_INTERVAL', default=2.0, cast=float)
+CONTACT_NOTIFY_EMAILS = config('CONTACT_NOTIFY_EMAILS', default='', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
 
 # Message settings
 from django.contrib.messages import constants as messages
@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from books.models import Book, SessionCart
+from .db_router import PIN_COOKIE
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsAccessTests(TestCase):
+    def test_metrics_are_not_public(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403,
+        )
+
+    def test_staff_and_token_holders_can_read_metrics(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_user('ops', is_staff=True))
+        self.assertContains(self.client.get(reverse('metrics')), 'bookstore_request_duration_seconds')
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_is_opt_in(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('books:about_page')))
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing(self):
+        self.assertIn('Server-Timing', self.client.get(reverse('books:about_page')))
+
+    @override_settings(METRICS_ENABLED=False, METRICS_SERVER_TIMING=True)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('books:about_page')))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+@override_settings(
+    DATABASE_ROUTERS=['bookstore.db_router.ReplicaRouter'],
+    DATABASE_REPLICAS=['replica'],
+    REPLICA_PIN_SECONDS=10,
+)
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        # The same book under a different title on each database shows
+        # where a page read it from
+        cls.book = Book.objects.create(title='On the primary', author='A', description='d', price=100, stock=5)
+        Book.objects.using('replica').create(
+            id=cls.book.id, slug=cls.book.slug, title='On the replica', author='A', description='d', price=100, stock=5,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def listed_titles(self):
+        response = self.client.get(reverse('book-list'), HTTP_ACCEPT='application/json')
+        return [book['title'] for book in response.json()['results']]
+
+    def test_catalog_reads_go_to_the_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.listed_titles(), ['On the replica'])
+        # Values stored in the shared cache (the facet counts) still come
+        # from the primary, see books.cache
+        self.assertTrue(replica.captured_queries)
+
+    def test_writes_go_to_the_primary_and_pin_the_client(self):
+        response = self.client.post(reverse('books:add_to_cart'), {'book_id': self.book.id})
+        self.assertTrue(SessionCart.objects.using('default').exists())
+        self.assertFalse(SessionCart.objects.using('replica').exists())
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        self.assertEqual(self.listed_titles(), ['On the primary'])
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertEqual(self.listed_titles(), ['On the replica'])
@@ -18,10 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from bookstore.instrumentation import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('books.urls')),
+    path('api/_metrics', metrics_view, name='metrics'),
     path('api/', include('books.api_urls')),
     path('orders/', include('orders.urls')),
 ]
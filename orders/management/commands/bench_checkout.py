@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from books.models import Book
+from orders.services import place_order
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure queries and time taken by checkout for different cart sizes (nothing is kept)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 20, 100])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        customer = {
+            'name': 'Benchmark Customer',
+            'email': 'bench@example.com',
+            'phone': '0000000000',
+            'address': 'Benchmark Street',
+        }
+        self.stdout.write(f'{"cart size":>10} {"queries":>8} {"ms/order":>10}')
+        for size in options['sizes']:
+            timings = []
+            for _ in range(options['repeat']):
+                try:
+                    with transaction.atomic():
+                        Book.objects.bulk_create([
+                            Book(
+                                title=f'Benchmark book {i}',
+                                slug=f'benchmark-book-{size}-{i}',
+                                author='Benchmark',
+                                description='Checkout benchmark',
+                                price=100 + i,
+                            )
+                            for i in range(size)
+                        ])
+                        items = {
+                            str(book.id): {'quantity': 1, 'price': str(book.price)}
+                            for book in Book.objects.filter(slug__startswith=f'benchmark-book-{size}-')
+                        }
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            place_order(items, customer)
+                            timings.append(time.perf_counter() - start)
+                        raise Rollback
+                except Rollback:
+                    pass
+            average = sum(timings) / len(timings) * 1000
+            self.stdout.write(f'{size:>10} {len(queries):>8} {average:>10.2f}')
@@ -36,6 +36,12 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Order history, newest first
+            models.Index(fields=['-created_at'], name='order_newest'),
+            # Admin's status filter and background jobs skipping cancelled orders
+            models.Index(fields=['status', '-created_at'], name='order_status_newest'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.customer.name}"
@@ -0,0 +1,87 @@
+"""
+Checkout service.
+
+``place_order`` turns cart contents into an order with a fixed number of
+queries regardless of cart size. Books and their current prices are read
+in one query (prices are never taken from the cart), stock for every book
+is decremented with one conditional ``UPDATE`` (see ``books.inventory``)
+and order items are written with one ``bulk_create``.
+
+Everything that doesn't have to happen before the customer sees their
+order (taking sold-out books off the storefront, the confirmation email,
+analytics) is queued for the task workers, see ``orders.tasks``. Orders
+leave cached catalog pages alone: they only change when a book sells out,
+and ``reconcile_stock`` invalidates them then.
+"""
+from django.db import transaction
+
+from books.inventory import consume_stock
+from books.models import Book
+from taskqueue.queue import enqueue_many
+from . import tasks
+from .models import Customer, Order, OrderItem
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class BooksUnavailable(CheckoutError):
+    """Some books in the cart have sold out or been removed"""
+
+    def __init__(self, book_ids):
+        self.book_ids = book_ids
+        super().__init__(f'Books no longer available: {sorted(book_ids)}')
+
+
+class StockConflict(CheckoutError):
+    """Another checkout took the last copies while this one was running"""
+
+
+def place_order(items, customer_data):
+    """
+    Create an order for ``items`` (cart items keyed by book id) and a new
+    customer built from ``customer_data``. Raises ``BooksUnavailable`` if
+    any of the books can no longer be bought in the requested quantity.
+    """
+    quantities = {int(book_id): int(item['quantity']) for book_id, item in items.items()}
+    if not quantities:
+        raise CheckoutError('Cart is empty')
+
+    books = {
+        book_id: (price, stock)
+        for book_id, price, stock in Book.objects.filter(
+            id__in=quantities, is_available=True
+        ).values_list('id', 'price', 'stock')
+    }
+    short = {
+        book_id for book_id, quantity in quantities.items()
+        if book_id not in books or books[book_id][1] < quantity
+    }
+    if short:
+        raise BooksUnavailable(short)
+
+    with transaction.atomic():
+        if not consume_stock(quantities):
+            raise StockConflict('Stock changed while placing the order')
+
+        customer = Customer.objects.create(**customer_data)
+        order = Order.objects.create(
+            customer=customer,
+            total_price=sum(books[book_id][0] * quantity for book_id, quantity in quantities.items()),
+            status='pending',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book_id=book_id, quantity=quantity, price=books[book_id][0])
+            for book_id, quantity in quantities.items()
+        ])
+
+        # Queued in the same transaction, so the tasks exist only if the
+        # order does.
+        enqueue_many([
+            (tasks.reconcile_stock, {'book_ids': list(quantities)}),
+            (tasks.send_order_confirmation, {'order_id': order.id}),
+            (tasks.record_order_analytics, {'order_id': order.id}),
+        ])
+
+    return order
@@ -0,0 +1,54 @@
+"""
+Order post-processing, run by the task queue workers after checkout.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from books.cache import bump_catalog_version
+from books.inventory import mark_sold_out
+from books.models import Book
+from books.stats import refresh_category_stats
+from taskqueue.queue import task
+from .models import Order
+
+
+analytics = logging.getLogger('orders.analytics')
+
+
+@task
+def reconcile_stock(book_ids):
+    """Take books that sold out off the storefront"""
+    if mark_sold_out(book_ids):
+        category_ids = Book.objects.filter(id__in=book_ids).values_list('category_id', flat=True)
+        refresh_category_stats(set(category_ids) - {None})
+        bump_catalog_version()
+
+
+@task
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('customer').get(id=order_id)
+    items = order.items.select_related('book')
+    send_mail(
+        subject=f'Your order #{order.id}',
+        message=render_to_string('orders/email/confirmation.txt', {'order': order, 'items': items}),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[order.customer.email],
+    )
+
+
+@task
+def record_order_analytics(order_id):
+    order = Order.objects.get(id=order_id)
+    quantities = list(order.items.values_list('book_id', 'quantity'))
+    analytics.info(
+        'order placed',
+        extra={
+            'order_id': order.id,
+            'total_price': str(order.total_price),
+            'books': len(quantities),
+            'copies': sum(quantity for _, quantity in quantities),
+        },
+    )
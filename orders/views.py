@@ -1,15 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db import transaction
-from .models import Customer, Order, OrderItem
-from books.models import Book
+from .models import Order
+from books.cart import Cart
 from .forms import CheckoutForm
-from decimal import Decimal
+from .services import BooksUnavailable, StockConflict, place_order
 
 
 def checkout(request):
     """Checkout page"""
-    cart = request.session.get('cart', {})
+    cart = Cart.for_request(request)
     
     if not cart:
         messages.warning(request, 'Your cart is empty!')
@@ -18,71 +17,29 @@ def checkout(request):
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            with transaction.atomic():
-                # Create customer
-                customer = Customer.objects.create(
-                    name=form.cleaned_data['name'],
-                    email=form.cleaned_data['email'],
-                    phone=form.cleaned_data['phone'],
-                    address=form.cleaned_data['address'],
-                )
-                
-                # Calculate total price
-                total_price = Decimal('0.00')
-                for book_id, item in cart.items():
-                    total_price += Decimal(item['price']) * item['quantity']
-                
-                # Create order
-                order = Order.objects.create(
-                    customer=customer,
-                    total_price=total_price,
-                    status='pending'
-                )
-                
-                # Create order items and update book availability
-                for book_id, item in cart.items():
-                    book = Book.objects.get(id=book_id)
-                    OrderItem.objects.create(
-                        order=order,
-                        book=book,
-                        quantity=item['quantity'],
-                        price=Decimal(item['price'])
-                    )
-                    
-                    # Mark book as sold
-                    book.is_available = False
-                    book.save()
-                
-                # Clear cart
-                request.session['cart'] = {}
-                
-                messages.success(request, f'Order #{order.id} placed successfully!')
-                return redirect('orders:order_success', order_id=order.id)
+            try:
+                order = place_order(cart.items, form.cleaned_data)
+            except BooksUnavailable as exc:
+                for book_id in exc.book_ids:
+                    cart.remove(book_id)
+                messages.error(request, 'Some books in your cart are no longer available and have been removed.')
+                return redirect('books:cart_view')
+            except StockConflict:
+                messages.error(request, 'Stock changed while placing your order. Please try again.')
+                return redirect('orders:checkout')
+            
+            # Clear cart
+            cart.clear()
+            
+            messages.success(request, f'Order #{order.id} placed successfully!')
+            return redirect('orders:order_success', order_id=order.id)
     else:
         form = CheckoutForm()
     
-    # Calculate cart total for display
-    cart_items = []
-    total_price = Decimal('0.00')
-    
-    for book_id, item in cart.items():
-        item_total = Decimal(item['price']) * item['quantity']
-        total_price += item_total
-        
-        cart_items.append({
-            'book_id': book_id,
-            'title': item['title'],
-            'author': item['author'],
-            'price': Decimal(item['price']),
-            'quantity': item['quantity'],
-            'image': item['image'],
-            'item_total': item_total,
-        })
-    
     context = {
         'form': form,
-        'cart_items': cart_items,
-        'total_price': total_price,
+        'cart_items': cart.lines(),
+        'total_price': cart.total(),
     }
     
     return render(request, 'orders/checkout.html', context)
@@ -90,7 +47,7 @@ def checkout(request):
 
 def order_success(request, order_id):
     """Order success page"""
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(Order.objects.select_related('customer'), id=order_id)
     
     context = {
         'order': order,
@@ -102,7 +59,7 @@ def order_success(request, order_id):
 def order_history(request):
     """Order history (for future customer account feature)"""
     # This would be implemented with customer authentication
-    orders = Order.objects.all().order_by('-created_at')[:10]
+    orders = Order.objects.select_related('customer').order_by('-created_at')[:10]
     
     context = {
         'orders': orders,
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from taskqueue.queue import run_batch
+
+
+def work(stop, batch_size, poll_interval, burst):
+    # Ctrl-C is handled by the parent, which then sets ``stop`` so the
+    # current batch can finish.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        while not stop.is_set():
+            if run_batch(batch_size):
+                continue
+            if burst:
+                break
+            stop.wait(poll_interval)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers (see taskqueue.queue)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Tasks claimed by a worker at a time')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        args = (options['batch_size'], options['poll_interval'], options['burst'])
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        processes = [
+            context.Process(target=work, args=(stop, *args), name=f'task-worker-{n}')
+            for n in range(workers)
+        ]
+
+        def shutdown(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        self.stdout.write(f'Starting {workers} task workers...')
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS(
+            f'Task workers stopped after {time.perf_counter() - start:.1f}s'
+        ))
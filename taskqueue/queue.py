@@ -0,0 +1,152 @@
+"""
+Database-backed task queue.
+
+Functions decorated with ``@task`` can be queued with ``enqueue`` (or
+``enqueue_many``); a row is written to the ``Task`` table and picked up
+later by the ``run_workers`` command. Because tasks are ordinary rows,
+enqueueing inside a transaction means they only become visible if that
+transaction commits.
+
+Workers claim a batch of due tasks with a single conditional ``UPDATE``
+tagged with a random claim token, so several worker processes can share
+the queue without handing the same task to two of them. Failed tasks are
+retried with exponential backoff until ``max_attempts`` is reached, and
+tasks left running by a crashed worker are claimed again after
+``TASK_CLAIM_TIMEOUT`` seconds (or marked failed if that was their last
+attempt).
+
+With ``TASKS_EAGER = True`` tasks run in the calling process instead, which
+is handy in development when no worker is running. They still run only
+once the caller's transaction commits, and a failing task is logged rather
+than raised, so it can't undo or break the work that queued it.
+"""
+import logging
+import traceback
+import uuid
+from functools import partial
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(func):
+    """Register ``func`` so it can be queued under ``module.name``"""
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    registry[func.task_name] = func
+    return func
+
+
+def _task_name(func):
+    return func if isinstance(func, str) else func.task_name
+
+
+def _eager():
+    return getattr(settings, 'TASKS_EAGER', False)
+
+
+def enqueue(func, delay=None, max_attempts=3, **kwargs):
+    """
+    Queue ``func(**kwargs)``, to run no earlier than ``delay`` seconds from
+    now. ``kwargs`` must be JSON serializable. Returns the ``Task`` row, or
+    ``None`` when running eagerly.
+    """
+    tasks = enqueue_many([(func, kwargs)], delay=delay, max_attempts=max_attempts)
+    return tasks[0] if tasks else None
+
+
+def enqueue_many(calls, delay=None, max_attempts=3):
+    """Queue several ``(func, kwargs)`` calls with one ``INSERT``"""
+    if _eager():
+        for func, kwargs in calls:
+            transaction.on_commit(partial(_run_eagerly, _task_name(func), kwargs))
+        return []
+
+    run_at = timezone.now() + timedelta(seconds=delay or 0)
+    return Task.objects.bulk_create([
+        Task(name=_task_name(func), kwargs=kwargs, run_at=run_at, max_attempts=max_attempts)
+        for func, kwargs in calls
+    ])
+
+
+def _run_eagerly(name, kwargs):
+    try:
+        with transaction.atomic():
+            registry[name](**kwargs)
+    except Exception:
+        logger.exception('Task %s failed', name)
+
+
+def claim_tasks(limit):
+    """
+    Mark up to ``limit`` due tasks as running for this worker and return
+    them. Stale running tasks that have no attempts left are marked failed.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=getattr(settings, 'TASK_CLAIM_TIMEOUT', 300))
+    Task.objects.filter(status='running', claimed_at__lt=stale, attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=now, last_error='Worker stopped while running the last attempt',
+    )
+    due = Q(status='queued', run_at__lte=now) | Q(
+        status='running', claimed_at__lt=stale, attempts__lt=F('max_attempts'),
+    )
+    candidates = list(Task.objects.filter(due).order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+    if not candidates:
+        return []
+
+    # Only rows still due when the UPDATE runs are claimed, so a task
+    # another worker grabbed in the meantime is skipped.
+    claim = uuid.uuid4().hex
+    Task.objects.filter(due, id__in=candidates).update(
+        status='running', claim=claim, claimed_at=now, attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(claim=claim))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a task that has failed ``attempts`` times"""
+    return min(10 * 2 ** (attempts - 1), 3600)
+
+
+def run_task(task_row):
+    """Run a claimed task and record the outcome. Returns ``True`` on success."""
+    func = registry.get(task_row.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {task_row.name!r}')
+        with transaction.atomic():
+            func(**task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Task %s #%s failed', task_row.name, task_row.id)
+        if func is not None and task_row.attempts < task_row.max_attempts:
+            updates = {
+                'status': 'queued',
+                'run_at': timezone.now() + timedelta(seconds=backoff(task_row.attempts)),
+            }
+        else:
+            updates = {'status': 'failed', 'finished_at': timezone.now()}
+        Task.objects.filter(id=task_row.id, claim=task_row.claim).update(last_error=error, **updates)
+        return False
+
+    Task.objects.filter(id=task_row.id, claim=task_row.claim).update(
+        status='done', finished_at=timezone.now(), last_error='',
+    )
+    return True
+
+
+def run_batch(limit=10):
+    """Claim and run up to ``limit`` tasks; returns how many were run"""
+    tasks = claim_tasks(limit)
+    for task_row in tasks:
+        run_task(task_row)
+    return len(tasks)
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import claim_tasks, enqueue, task
+
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task
+def explode():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASKS_EAGER=True)
+class EagerTaskTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_tasks_run_after_the_transaction_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                enqueue(record, value=1)
+                self.assertEqual(calls, [])
+        self.assertEqual(calls, [1])
+
+    def test_failing_task_is_not_raised_to_the_caller(self):
+        with self.assertLogs('taskqueue.queue', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                enqueue(explode)
+                enqueue(record, value=2)
+        self.assertEqual(calls, [2])
+
+
+class ClaimTests(TestCase):
+    def test_stale_task_on_its_last_attempt_is_failed(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        retry = Task.objects.create(name=record.task_name, status='running', attempts=1, run_at=long_ago, claimed_at=long_ago)
+        dead = Task.objects.create(name=record.task_name, status='running', attempts=3, run_at=long_ago, claimed_at=long_ago)
+
+        self.assertEqual([row.id for row in claim_tasks(10)], [retry.id])
+        dead.refresh_from_db()
+        self.assertEqual(dead.status, 'failed')
+        self.assertIsNotNone(dead.finished_at)